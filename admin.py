@@ -1,10 +1,11 @@
+import asyncio
 import os
-import io
 import logging
+import time
+from functools import lru_cache, partial
 from datetime import datetime
 from typing import Optional
 
-import pandas as pd
 from aiogram import Router, F, types
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
@@ -14,15 +15,40 @@ from aiogram.types import (
     InlineKeyboardButton,
     ReplyKeyboardMarkup,
     KeyboardButton,
-    BufferedInputFile,
 )
-from sqlalchemy import select, update
-
-from database import async_session, Employee, KPI, Advance, Penalty, SalaryHistory
+from sqlalchemy import select, update, insert
+
+from database import async_session, Employee, KPI, Advance, Penalty, SalaryHistory, current_period
+from balance import (
+    get_balances,
+    get_employee_balance,
+    get_monthly_totals,
+    apply_ledger_entry,
+    close_ledger_month,
+    rebuild_employee_balances,
+    verify_employee_balances,
+)
+from cache import (
+    bump_roster_version,
+    bump_ledger_version,
+    get_pending_count,
+    adjust_pending_count,
+    employee_directory,
+    rendered_responses,
+    view_key,
+    is_displayed,
+)
+from pagination import PICKERS, render_picker_page, parse_picker_callback
+from jobs import report_queue, ReportQueueFull
+from outbox import enqueue_notification, enqueue_notifications, wake_dispatcher
+from query_budget import query_budget
 
 logger = logging.getLogger(__name__)
 
 ADMIN_ID = int(os.getenv("ADMIN_ID", "1064992756"))
+# Telegram inline klaviaturasida 100 tagacha tugma bo'ladi, bittasi "Hammasini to'lash" uchun
+UNPAID_LIST_LIMIT = 99
+DRILLDOWN_MONTHS = 12
 
 admin_router = Router()
 
@@ -51,21 +77,20 @@ class ActionFSM(StatesGroup):
 # YORDAMCHI FUNKSIYALAR
 # =========================
 def get_current_month() -> str:
-    return datetime.now().strftime("%Y-%m")
+    return current_period()
 
 
 def fmt_money(value: float) -> str:
     return f"{value:,.0f} so'm"
 
 
-async def get_admin_menu(session):
-    pending_count = len(
-        (
-            await session.execute(
-                select(Employee.id).where(Employee.status == "pending")
-            )
-        ).scalars().all()
-    )
+async def get_admin_menu(session=None):
+    pending_count = await get_pending_count(session)
+    return build_admin_menu(pending_count)
+
+
+@lru_cache(maxsize=64)
+def build_admin_menu(pending_count: int):
     req_text = f"📩 So'rovlar ({pending_count})" if pending_count > 0 else "📩 So'rovlar"
 
     return ReplyKeyboardMarkup(
@@ -83,89 +108,41 @@ async def get_admin_menu(session):
 
 
 async def calculate_employee_balance(session, emp_id: int):
-    emp = await session.get(Employee, emp_id)
-    if not emp:
-        return None
-
-    kpis = sum((
-        await session.scalars(
-            select(KPI.amount).where(
-                KPI.employee_id == emp_id,
-                KPI.is_closed == False
-            )
-        )
-    ).all())
-
-    advances = sum((
-        await session.scalars(
-            select(Advance.amount).where(
-                Advance.employee_id == emp_id,
-                Advance.is_closed == False
-            )
-        )
-    ).all())
-
-    penalties = sum((
-        await session.scalars(
-            select(Penalty.amount).where(
-                Penalty.employee_id == emp_id,
-                Penalty.is_closed == False
-            )
-        )
-    ).all())
-
-    current_balance = emp.base_salary + kpis - advances - penalties
-
-    return {
-        "employee": emp,
-        "kpis": kpis,
-        "advances": advances,
-        "penalties": penalties,
-        "current_balance": current_balance
-    }
+    return await get_employee_balance(session, emp_id)
 
 
 async def get_or_create_salary_sheet_for_month(session, month: str):
-    employees = (
-        await session.execute(
-            select(Employee).where(Employee.status == "approved")
-        )
-    ).scalars().all()
-
-    created_count = 0
-
-    for emp in employees:
-        exists = await session.scalar(
-            select(SalaryHistory).where(
-                SalaryHistory.employee_id == emp.id,
-                SalaryHistory.month == month
-            )
-        )
-        if exists:
-            continue
-
-        calc = await calculate_employee_balance(session, emp.id)
-        if not calc:
-            continue
-
-        session.add(
-            SalaryHistory(
-                employee_id=emp.id,
-                total_kpi=calc["kpis"],
-                total_advance=calc["advances"],
-                total_penalty=calc["penalties"],
-                final_salary=calc["current_balance"],
-                month=month,
-                is_paid=False,
-                is_closed=False
+    existing_ids = set(
+        (
+            await session.scalars(
+                select(SalaryHistory.employee_id).where(SalaryHistory.month == month)
             )
-        )
-        created_count += 1
+        ).all()
+    )
 
-    if created_count > 0:
+    balances = await get_balances(session, status="approved")
+
+    rows = [
+        {
+            "employee_id": emp_id,
+            "total_kpi": calc["kpis"],
+            "total_advance": calc["advances"],
+            "total_penalty": calc["penalties"],
+            "final_salary": calc["current_balance"],
+            "month": month,
+            "is_paid": False,
+            "is_closed": False,
+        }
+        for emp_id, calc in balances.items()
+        if emp_id not in existing_ids
+    ]
+
+    # ORM session.add() har bir qator uchun alohida INSERT beradi, bu esa bitta executemany
+    if rows:
+        await session.execute(insert(SalaryHistory), rows)
         await session.commit()
 
-    return created_count
+    return len(rows)
 
 
 async def get_unpaid_salary_rows(session, month: str):
@@ -182,15 +159,33 @@ async def get_unpaid_salary_rows(session, month: str):
     return rows.all()
 
 
+async def pay_all_salaries(session, month: str):
+    # Bitta UPDATE ... RETURNING: qaysi qatorlar to'langani darhol ma'lum bo'ladi,
+    # parallel ravishda alohida to'langan qatorlar ikkinchi marta hisoblanmaydi
+    result = await session.execute(
+        update(SalaryHistory)
+        .where(
+            SalaryHistory.month == month,
+            SalaryHistory.is_paid == False,
+            SalaryHistory.employee_id.in_(
+                select(Employee.id).where(Employee.status == "approved")
+            )
+        )
+        .values(is_paid=True, paid_at=datetime.now())
+        .returning(SalaryHistory.employee_id, SalaryHistory.final_salary)
+    )
+    return result.all()
+
+
 # =========================
 # START / CANCEL
 # =========================
 @admin_router.message(Command("cancel"))
 @admin_router.message(F.text == "🔙 Bekor qilish")
+@query_budget(0)
 async def cancel_handler(message: types.Message, state: FSMContext):
     await state.clear()
-    async with async_session() as session:
-        kb = await get_admin_menu(session)
+    kb = await get_admin_menu()
     await message.answer(
         "🚫 Barcha amallar bekor qilindi. Asosiy menyudasiz.",
         reply_markup=kb
@@ -199,10 +194,10 @@ async def cancel_handler(message: types.Message, state: FSMContext):
 
 @admin_router.message(CommandStart())
 @admin_router.message(Command("admin"))
+@query_budget(1)
 async def admin_start(message: types.Message, state: FSMContext):
     await state.clear()
-    async with async_session() as session:
-        kb = await get_admin_menu(session)
+    kb = await get_admin_menu()
     await message.answer(
         "👑 <b>Admin paneliga xush kelibsiz!</b>\n\nQuyidagi menyudan foydalaning:",
         reply_markup=kb,
@@ -214,28 +209,20 @@ async def admin_start(message: types.Message, state: FSMContext):
 # 1) SO'ROVLARNI TASDIQLASH
 # =========================
 @admin_router.message(F.text.startswith("📩 So'rovlar"))
+@query_budget(1)
 async def view_requests(message: types.Message, state: FSMContext):
     await state.clear()
     async with async_session() as session:
-        pendings = (
-            await session.execute(
-                select(Employee).where(Employee.status == "pending")
-            )
-        ).scalars().all()
+        kb = await render_picker_page(session, "approve")
 
-    if not pendings:
+    if not kb:
         return await message.answer("Yangi so'rovlar yo'q.")
 
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=f"✅ {emp.full_name}", callback_data=f"approve_{emp.id}")]
-            for emp in pendings
-        ]
-    )
     await message.answer("Tasdiqlash uchun ishchini tanlang:", reply_markup=kb)
 
 
 @admin_router.callback_query(F.data.startswith("approve_"))
+@query_budget(0)
 async def approve_step1(call: types.CallbackQuery, state: FSMContext):
     emp_id = int(call.data.split("_")[1])
     await state.update_data(emp_id=emp_id)
@@ -255,6 +242,7 @@ async def approve_step1(call: types.CallbackQuery, state: FSMContext):
 
 
 @admin_router.callback_query(ApproveFSM.salary_type, F.data.startswith("type_"))
+@query_budget(0)
 async def approve_step2(call: types.CallbackQuery, state: FSMContext):
     salary_type = call.data.split("_")[1]
     await state.update_data(salary_type=salary_type)
@@ -271,6 +259,7 @@ async def approve_step2(call: types.CallbackQuery, state: FSMContext):
 
 
 @admin_router.message(ApproveFSM.base_salary)
+@query_budget(3)
 async def approve_step3(message: types.Message, state: FSMContext):
     text = (message.text or "").replace(" ", "")
     if not text.isdigit():
@@ -279,6 +268,9 @@ async def approve_step3(message: types.Message, state: FSMContext):
     data = await state.get_data()
 
     async with async_session() as session:
+        prev_status = await session.scalar(
+            select(Employee.status).where(Employee.id == data["emp_id"])
+        )
         await session.execute(
             update(Employee)
             .where(Employee.id == data["emp_id"])
@@ -288,7 +280,18 @@ async def approve_step3(message: types.Message, state: FSMContext):
                 base_salary=float(text)
             )
         )
+        enqueue_notification(
+            session,
+            data["emp_id"],
+            "🎉 <b>Tabriklaymiz!</b> So'rovingiz tasdiqlandi. /start ni bosing."
+        )
         await session.commit()
+        wake_dispatcher()
+        bump_roster_version()
+        bump_ledger_version(data["emp_id"])
+        employee_directory.invalidate(data["emp_id"])
+        if prev_status == "pending":
+            adjust_pending_count(-1)
         kb = await get_admin_menu(session)
 
     await message.answer(
@@ -297,15 +300,6 @@ async def approve_step3(message: types.Message, state: FSMContext):
         parse_mode="HTML"
     )
 
-    try:
-        await message.bot.send_message(
-            chat_id=data["emp_id"],
-            text="🎉 <b>Tabriklaymiz!</b> So'rovingiz tasdiqlandi. /start ni bosing.",
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.warning("Userga approve xabar yuborilmadi: %s", e)
-
     await state.clear()
 
 
@@ -313,6 +307,7 @@ async def approve_step3(message: types.Message, state: FSMContext):
 # 2) PREMIA / AVANS / JARIMA
 # =========================
 @admin_router.message(F.text.in_(["📈 Mukofot pullari (Premiya)", "💸 Avans berish", "⚠️ Jarima yozish"]))
+@query_budget(1)
 async def select_action_emp(message: types.Message, state: FSMContext):
     await state.clear()
 
@@ -326,21 +321,11 @@ async def select_action_emp(message: types.Message, state: FSMContext):
     await state.update_data(action_type=action_type)
 
     async with async_session() as session:
-        employees = (
-            await session.execute(
-                select(Employee).where(Employee.status == "approved")
-            )
-        ).scalars().all()
+        kb = await render_picker_page(session, "emp")
 
-    if not employees:
+    if not kb:
         return await message.answer("❌ Tasdiqlangan ishchilar yo'q.")
 
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=emp.full_name, callback_data=f"emp_{emp.id}")]
-            for emp in employees
-        ]
-    )
     await message.answer(
         f"👤 {message.text} uchun ishchini tanlang:",
         reply_markup=kb
@@ -349,6 +334,7 @@ async def select_action_emp(message: types.Message, state: FSMContext):
 
 
 @admin_router.callback_query(ActionFSM.employee_id, F.data.startswith("emp_"))
+@query_budget(0)
 async def process_action_amount(call: types.CallbackQuery, state: FSMContext):
     employee_id = int(call.data.split("_")[1])
     await state.update_data(employee_id=employee_id)
@@ -358,6 +344,7 @@ async def process_action_amount(call: types.CallbackQuery, state: FSMContext):
 
 
 @admin_router.message(ActionFSM.amount)
+@query_budget(0)
 async def process_action_desc(message: types.Message, state: FSMContext):
     text = (message.text or "").replace(" ", "")
     if not text.isdigit():
@@ -378,6 +365,7 @@ async def process_action_desc(message: types.Message, state: FSMContext):
 
 
 @admin_router.message(ActionFSM.description)
+@query_budget(5)
 async def save_action(message: types.Message, state: FSMContext):
     data = await state.get_data()
     emp_id = data["employee_id"]
@@ -400,9 +388,21 @@ async def save_action(message: types.Message, state: FSMContext):
             session.add(Penalty(employee_id=emp_id, amount=amount, reason=message.text))
             text_type = "jarima yozildi ⚠️"
 
-        await session.commit()
+        await apply_ledger_entry(session, emp_id, action_type, amount)
 
         calc = await calculate_employee_balance(session, emp_id)
+        enqueue_notification(
+            session,
+            emp_id,
+            f"🔔 <b>Hisobingizda o'zgarish!</b>\n\n"
+            f"<b>{fmt_money(amount)}</b> {text_type}\n"
+            f"📝 Izoh: <i>{message.text}</i>\n"
+            f"💰 <b>Qoldiq: {fmt_money(calc['current_balance'])}</b>"
+        )
+        await session.commit()
+        bump_ledger_version(emp_id)
+        wake_dispatcher()
+
         kb = await get_admin_menu(session)
 
     await message.answer(
@@ -411,17 +411,6 @@ async def save_action(message: types.Message, state: FSMContext):
         parse_mode="HTML"
     )
 
-    try:
-        user_msg = (
-            f"🔔 <b>Hisobingizda o'zgarish!</b>\n\n"
-            f"<b>{fmt_money(amount)}</b> {text_type}\n"
-            f"📝 Izoh: <i>{message.text}</i>\n"
-            f"💰 <b>Qoldiq: {fmt_money(calc['current_balance'])}</b>"
-        )
-        await message.bot.send_message(chat_id=emp_id, text=user_msg, parse_mode="HTML")
-    except Exception as e:
-        logger.warning("Userga action xabar yuborilmadi: %s", e)
-
     await state.clear()
 
 
@@ -429,61 +418,115 @@ async def save_action(message: types.Message, state: FSMContext):
 # 3) ISHCHILAR MA'LUMOTI
 # =========================
 @admin_router.message(F.text == "📋 Ishchilar ma'lumoti")
+@query_budget(1)
 async def show_employee_list(message: types.Message, state: FSMContext):
     await state.clear()
 
     async with async_session() as session:
-        employees = (
-            await session.execute(
-                select(Employee).where(Employee.status == "approved")
-            )
-        ).scalars().all()
+        kb = await render_picker_page(session, "empinfo")
 
-    if not employees:
+    if not kb:
         return await message.answer("❌ Hozircha ishchilar yo'q.")
 
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=f"👤 {emp.full_name}", callback_data=f"empinfo_{emp.id}")]
-            for emp in employees
-        ]
-    )
     await message.answer("📋 Profilini ko'rish uchun ishchini tanlang:", reply_markup=kb)
 
 
-@admin_router.callback_query(F.data.startswith("empinfo_"))
-async def show_employee_profile(call: types.CallbackQuery):
-    emp_id = int(call.data.split("_")[1])
+@admin_router.callback_query(F.data.startswith("pg_"))
+@query_budget(1)
+async def picker_page(call: types.CallbackQuery):
+    kind, direction, anchor_id = parse_picker_callback(call.data)
+    if kind not in PICKERS:
+        return await call.answer()
 
     async with async_session() as session:
-        calc = await calculate_employee_balance(session, emp_id)
-        if not calc:
-            return await call.answer("Ishchi topilmadi.", show_alert=True)
+        kb = await render_picker_page(session, kind, direction, anchor_id)
 
-        emp = calc["employee"]
+    if not kb:
+        return await call.answer("Ro'yxat o'zgargan. Menyudan qaytadan oching.", show_alert=True)
 
-    s_type_text = "Belgilangan oylik (Oklad)" if emp.salary_type == "Fix" else "Qilingan ishga qarab (Foiz)"
+    await call.message.edit_reply_markup(reply_markup=kb)
+    await call.answer()
 
-    text = (
-        f"👤 <b>{emp.full_name} ma'lumotlari:</b>\n"
-        f"📞 Tel: {emp.phone}\n"
-        f"💼 Oylik turi: {s_type_text}\n"
-        f"💵 Asosiy maosh: {fmt_money(emp.base_salary)}\n\n"
-        f"📈 Berilgan premiyalar: +{fmt_money(calc['kpis'])}\n"
-        f"💸 Olingan avanslar: -{fmt_money(calc['advances'])}\n"
-        f"⚠️ Jarimalar: -{fmt_money(calc['penalties'])}\n"
-        f"〰️〰️〰️〰️〰️〰️〰️〰️〰️\n"
-        f"💰 <b>Qo'lga tegadigan joriy qoldiq: {fmt_money(calc['current_balance'])}</b>"
-    )
+
+@admin_router.callback_query(F.data.startswith("empinfo_"))
+@query_budget(1)
+async def show_employee_profile(call: types.CallbackQuery):
+    emp_id = int(call.data.split("_")[1])
+
+    key = view_key(emp_id, "profile")
+    text = rendered_responses.get(key)
+    if text is None:
+        async with async_session() as session:
+            calc = await calculate_employee_balance(session, emp_id)
+            if not calc:
+                return await call.answer("Ishchi topilmadi.", show_alert=True)
+
+            emp = calc["employee"]
+
+        s_type_text = "Belgilangan oylik (Oklad)" if emp.salary_type == "Fix" else "Qilingan ishga qarab (Foiz)"
+
+        text = (
+            f"👤 <b>{emp.full_name} ma'lumotlari:</b>\n"
+            f"📞 Tel: {emp.phone}\n"
+            f"💼 Oylik turi: {s_type_text}\n"
+            f"💵 Asosiy maosh: {fmt_money(emp.base_salary)}\n\n"
+            f"📈 Berilgan premiyalar: +{fmt_money(calc['kpis'])}\n"
+            f"💸 Olingan avanslar: -{fmt_money(calc['advances'])}\n"
+            f"⚠️ Jarimalar: -{fmt_money(calc['penalties'])}\n"
+            f"〰️〰️〰️〰️〰️〰️〰️〰️〰️\n"
+            f"💰 <b>Qo'lga tegadigan joriy qoldiq: {fmt_money(calc['current_balance'])}</b>"
+        )
+        rendered_responses.set(key, text)
 
     kb = InlineKeyboardMarkup(
         inline_keyboard=[
+            [InlineKeyboardButton(text="📅 Oylar bo'yicha", callback_data=f"empmonths_{emp_id}")],
             [InlineKeyboardButton(text="📥 Shaxsiy hisobotni yuklash", callback_data=f"empexcel_{emp_id}")],
             [InlineKeyboardButton(text="🚫 Ishchini chetlatish", callback_data=f"fire_{emp_id}")]
         ]
     )
 
-    await call.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    if not is_displayed(call.message, text, kb):
+        await call.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    await call.answer()
+
+
+@admin_router.callback_query(F.data.startswith("empmonths_"))
+@query_budget(2)
+async def show_employee_months(call: types.CallbackQuery):
+    emp_id = int(call.data.split("_")[1])
+
+    key = view_key(emp_id, "months")
+    text = rendered_responses.get(key)
+    if text is None:
+        # Oxirgi DRILLDOWN_MONTHS oy: (employee_id, period) indeksi bo'yicha bitta oraliq so'rov
+        year, month = map(int, get_current_month().split("-"))
+        first = year * 12 + month - DRILLDOWN_MONTHS
+        start = f"{first // 12:04d}-{first % 12 + 1:02d}"
+
+        async with async_session() as session:
+            emp = await employee_directory.get(emp_id, session)
+            if not emp:
+                return await call.answer("Ishchi topilmadi.", show_alert=True)
+            months = await get_monthly_totals(session, emp_id, start)
+
+        lines = "\n".join(
+            f"<b>{row['period']}</b>: 📈 +{fmt_money(row['kpis'])}, "
+            f"💸 -{fmt_money(row['advances'])}, ⚠️ -{fmt_money(row['penalties'])}"
+            for row in months
+        ) or f"Oxirgi {DRILLDOWN_MONTHS} oyda yozuvlar yo'q."
+
+        text = f"📅 <b>{emp.full_name}: oylar bo'yicha</b>\n\n{lines}"
+        rendered_responses.set(key, text)
+
+    kb = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="🔙 Orqaga", callback_data=f"empinfo_{emp_id}")]
+        ]
+    )
+
+    if not is_displayed(call.message, text, kb):
+        await call.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
     await call.answer()
 
 
@@ -491,6 +534,7 @@ async def show_employee_profile(call: types.CallbackQuery):
 # 4) ISHCHINI CHETLATISH
 # =========================
 @admin_router.callback_query(F.data.startswith("fire_"))
+@query_budget(0)
 async def fire_prompt(call: types.CallbackQuery):
     emp_id = int(call.data.split("_")[1])
     kb = InlineKeyboardMarkup(
@@ -509,6 +553,7 @@ async def fire_prompt(call: types.CallbackQuery):
 
 
 @admin_router.callback_query(F.data.startswith("fireconf_"))
+@query_budget(2)
 async def fire_confirm(call: types.CallbackQuery):
     emp_id = int(call.data.split("_")[1])
 
@@ -519,6 +564,9 @@ async def fire_confirm(call: types.CallbackQuery):
 
         emp.status = "fired"
         await session.commit()
+        bump_roster_version()
+        bump_ledger_version(emp_id)
+        employee_directory.invalidate(emp_id)
 
     await call.message.edit_text("✅ Xodim chetlatildi va faol ro'yxatdan chiqarildi.")
     await call.answer("Bajarildi")
@@ -527,74 +575,97 @@ async def fire_confirm(call: types.CallbackQuery):
 # =========================
 # 5) EXCEL HISOBOT
 # =========================
+# Handler faqat ishni navbatga qo'yadi; Excel'ning o'z so'rovlari sinxron engine'da,
+# hisobot navbatida bajariladi va query_budget.py'da render_report_* sifatida alohida sanaladi
 @admin_router.message(F.text == "📥 Umumiy hisobot")
+@query_budget(0)
 async def export_excel_all(message: types.Message):
-    await message.answer("⏳ Hisobot tayyorlanmoqda...")
     await export_excel_logic(message, None)
 
 
 @admin_router.callback_query(F.data.startswith("empexcel_"))
+@query_budget(0)
 async def export_excel_single(call: types.CallbackQuery):
     emp_id = int(call.data.split("_")[1])
-    await call.message.answer("⏳ Shaxsiy hisobot tayyorlanmoqda...")
     await export_excel_logic(call.message, emp_id)
     await call.answer()
 
 
-async def export_excel_logic(message: types.Message, single_emp_id: Optional[int] = None):
-    report_data = []
+# job_id -> "⏳" xabari uchun future (tayyor bo'lganda xabar o'chiriladi)
+_report_acks = {}
 
-    async with async_session() as session:
-        query = select(Employee).where(Employee.status == "approved")
-        if single_emp_id:
-            query = query.where(Employee.id == single_emp_id)
 
-        employees = (await session.execute(query)).scalars().all()
+@admin_router.callback_query(F.data.startswith("cancelreport_"))
+@query_budget(0)
+async def cancel_report(call: types.CallbackQuery):
+    job_id = int(call.data.split("_")[1])
 
-        if not employees:
-            return await message.answer("❌ Hisobot tayyorlash uchun ma'lumot yo'q.")
+    if not report_queue.cancel(job_id):
+        return await call.answer("Hisobot allaqachon tayyor yoki bekor qilingan.")
 
-        for emp in employees:
-            calc = await calculate_employee_balance(session, emp.id)
-            if not calc:
-                continue
+    _report_acks.pop(job_id, None)
+    await call.message.edit_text("🚫 Hisobot bekor qilindi.")
+    await call.answer()
+
+
+async def export_excel_logic(message: types.Message, single_emp_id: Optional[int] = None):
+    # openpyxl faqat hisobot kerak bo'lganda yuklanadi - bot ishga tushishi tezroq
+    from reports import render_report
 
-            s_type_text = "Oklad" if emp.salary_type == "Fix" else "Foiz"
+    try:
+        job_id = report_queue.submit(
+            render_report,
+            single_emp_id,
+            on_done=partial(_deliver_report, message)
+        )
+    except ReportQueueFull:
+        return await message.answer("⚠️ Hisobotlar navbati to'la. Birozdan keyin qayta urinib ko'ring.")
 
-            report_data.append({
-                "F.I.SH": emp.full_name,
-                "Telefon raqami": emp.phone,
-                "Oylik turi": s_type_text,
-                "Asosiy maosh (so'm)": emp.base_salary,
-                "Premiya (so'm)": calc["kpis"],
-                "Avans (so'm)": calc["advances"],
-                "Jarima (so'm)": calc["penalties"],
-                "Joriy qoldiq (so'm)": calc["current_balance"],
-            })
+    # Joy await'dan oldin band qilinadi: ish "⏳" xabari yuborilishidan oldin tugasa ham,
+    # _deliver_report xabarni kutib, keyin o'chiradi
+    ack = asyncio.get_running_loop().create_future()
+    _report_acks[job_id] = ack
 
-    df = pd.DataFrame(report_data)
-    output = io.BytesIO()
+    kb = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="❌ Bekor qilish", callback_data=f"cancelreport_{job_id}")]
+        ]
+    )
+    text = "⏳ Shaxsiy hisobot tayyorlanmoqda..." if single_emp_id else "⏳ Hisobot tayyorlanmoqda..."
+    try:
+        ack.set_result(await message.answer(text, reply_markup=kb))
+    except BaseException:
+        ack.set_result(None)
+        raise
+    return job_id
 
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="Hisobot")
-        ws = writer.sheets["Hisobot"]
 
-        for column_cells in ws.columns:
-            max_length = max(len(str(cell.value)) if cell.value is not None else 0 for cell in column_cells)
-            ws.column_dimensions[column_cells[0].column_letter].width = max_length + 2
+async def _deliver_report(message: types.Message, job_id: int, report, error):
+    pending_ack = _report_acks.pop(job_id, None)
 
-    output.seek(0)
+    try:
+        ack = await pending_ack if pending_ack is not None else None
+        if error is not None:
+            await message.answer("❌ Hisobot tayyorlashda xatolik yuz berdi.")
+        elif not report:
+            await message.answer("❌ Hisobot tayyorlash uchun ma'lumot yo'q.")
+        else:
+            await message.answer_document(document=report.as_input_file())
 
-    file_name = f"Shaxsiy_{single_emp_id}.xlsx" if single_emp_id else "Umumiy_Hisobot.xlsx"
-    await message.answer_document(
-        document=BufferedInputFile(output.read(), filename=file_name)
-    )
+        if ack:
+            await ack.delete()
+    except Exception as e:
+        logger.warning("Hisobot #%s yuborilmadi: %s", job_id, e)
+    finally:
+        if report:
+            report.cleanup()
 
 
 # =========================
 # 6) OYLIKNI TO'LASH
 # =========================
 @admin_router.message(F.text == "💵 Oylikni to'lash")
+@query_budget(4)
 async def show_unpaid_salaries(message: types.Message, state: FSMContext):
     await state.clear()
     current_month = get_current_month()
@@ -610,26 +681,117 @@ async def show_unpaid_salaries(message: types.Message, state: FSMContext):
                 reply_markup=kb
             )
 
+        total = sum(salary_row.final_salary for salary_row, _ in unpaid_rows)
         kb = InlineKeyboardMarkup(
             inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text=f"✅ Hammasini to'lash ({len(unpaid_rows)} ta)",
+                        callback_data=f"payall_{current_month}"
+                    )
+                ]
+            ] + [
                 [
                     InlineKeyboardButton(
                         text=f"💵 {emp.full_name} — {fmt_money(salary_row.final_salary)}",
                         callback_data=f"pay_salary_{salary_row.id}"
                     )
                 ]
-                for salary_row, emp in unpaid_rows
+                for salary_row, emp in unpaid_rows[:UNPAID_LIST_LIMIT]
             ]
         )
 
+    more = (
+        f"\n... va yana {len(unpaid_rows) - UNPAID_LIST_LIMIT} ta ishchi (ro'yxatda ko'rsatilmagan)"
+        if len(unpaid_rows) > UNPAID_LIST_LIMIT else ""
+    )
     await message.answer(
-        f"📋 {current_month} uchun to'lanmagan oyliklar ro'yxati:\n\n"
-        f"To'langan ishchini tanlang:",
+        f"📋 {current_month} uchun to'lanmagan oyliklar ro'yxati:\n"
+        f"👥 {len(unpaid_rows)} ta ishchi, jami {fmt_money(total)}{more}\n\n"
+        f"To'langan ishchini tanlang yoki hammasini birdaniga to'lang:",
         reply_markup=kb
     )
 
 
+@admin_router.callback_query(F.data.startswith("payall_"))
+@query_budget(1)
+async def pay_all_prompt(call: types.CallbackQuery):
+    month = call.data.split("_")[1]
+
+    async with async_session() as session:
+        unpaid_rows = await get_unpaid_salary_rows(session, month)
+
+    if not unpaid_rows:
+        return await call.answer(f"✅ {month} uchun to'lanmagan oyliklar yo'q.", show_alert=True)
+
+    total = sum(salary_row.final_salary for salary_row, _ in unpaid_rows)
+    kb = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Ha, hammasini to'lash", callback_data=f"payallconf_{month}")],
+            [InlineKeyboardButton(text="❌ Yo'q, bekor qilish", callback_data="payallcancel")]
+        ]
+    )
+    await call.message.edit_text(
+        f"⚠️ <b>{month}</b> uchun <b>{len(unpaid_rows)}</b> ta ishchining oyligi "
+        f"to'langan deb belgilanadi.\n"
+        f"💰 Jami: <b>{fmt_money(total)}</b>\n\n"
+        f"Davom etamizmi?",
+        reply_markup=kb,
+        parse_mode="HTML"
+    )
+    await call.answer()
+
+
+@admin_router.callback_query(F.data == "payallcancel")
+@query_budget(0)
+async def pay_all_cancel(call: types.CallbackQuery):
+    await call.message.edit_text("❌ Ommaviy to'lov bekor qilindi.")
+    await call.answer()
+
+
+@admin_router.callback_query(F.data.startswith("payallconf_"))
+@query_budget(2)
+async def pay_all_confirm(call: types.CallbackQuery):
+    month = call.data.split("_")[1]
+
+    async with async_session() as session:
+        paid = await pay_all_salaries(session, month)
+        if not paid:
+            return await call.answer("ℹ️ To'lanmagan oyliklar qolmagan.", show_alert=True)
+
+        # Xabarnomalar to'lov bilan bitta tranzaksiyada navbatga qo'yiladi,
+        # yuborish tezligini outbox dispetcheri cheklaydi
+        await enqueue_notifications(
+            session,
+            (
+                (
+                    emp_id,
+                    f"💵 <b>Oyligingiz to'landi</b>\n\n"
+                    f"📅 Oy: <b>{month}</b>\n"
+                    f"💰 Summa: <b>{fmt_money(final_salary)}</b>"
+                )
+                for emp_id, final_salary in paid
+            )
+        )
+        await session.commit()
+    bump_ledger_version()
+    wake_dispatcher()
+
+    total = sum(final_salary for _, final_salary in paid)
+    logger.info("%s: %s ta oylik ommaviy to'landi, jami %s", month, len(paid), total)
+
+    await call.message.edit_text(
+        f"✅ <b>{month}</b> uchun oyliklar to'landi deb belgilandi.\n\n"
+        f"👥 Ishchilar: <b>{len(paid)}</b> ta\n"
+        f"💰 Jami: <b>{fmt_money(total)}</b>\n\n"
+        f"📨 Ishchilarga xabarnomalar navbat bilan yuboriladi.",
+        parse_mode="HTML"
+    )
+    await call.answer("To'landi deb belgilandi ✅")
+
+
 @admin_router.callback_query(F.data.startswith("pay_salary_"))
+@query_budget(4)
 async def mark_salary_as_paid(call: types.CallbackQuery):
     salary_id = int(call.data.split("_")[2])
 
@@ -647,7 +809,16 @@ async def mark_salary_as_paid(call: types.CallbackQuery):
 
         salary_row.is_paid = True
         salary_row.paid_at = datetime.now()
+        enqueue_notification(
+            session,
+            emp.id,
+            f"💵 <b>Oyligingiz to'landi</b>\n\n"
+            f"📅 Oy: <b>{salary_row.month}</b>\n"
+            f"💰 Summa: <b>{fmt_money(salary_row.final_salary)}</b>"
+        )
         await session.commit()
+        bump_ledger_version(emp.id)
+        wake_dispatcher()
 
         await call.message.edit_text(
             f"✅ <b>{emp.full_name}</b> uchun oylik to'landi deb belgilandi.\n"
@@ -656,19 +827,6 @@ async def mark_salary_as_paid(call: types.CallbackQuery):
             parse_mode="HTML"
         )
 
-        try:
-            await call.bot.send_message(
-                chat_id=emp.id,
-                text=(
-                    f"💵 <b>Oyligingiz to'landi</b>\n\n"
-                    f"📅 Oy: <b>{salary_row.month}</b>\n"
-                    f"💰 Summa: <b>{fmt_money(salary_row.final_salary)}</b>"
-                ),
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.warning("Userga oylik to'landi xabari yuborilmadi: %s", e)
-
     await call.answer("To'landi deb belgilandi ✅")
 
 
@@ -676,18 +834,17 @@ async def mark_salary_as_paid(call: types.CallbackQuery):
 # 7) OYLIK YOPISH
 # =========================
 @admin_router.message(F.text == "📊 Oylik yopish")
+@query_budget(10)
 async def close_month_handler(message: types.Message, state: FSMContext):
     await state.clear()
     current_month = get_current_month()
 
     async with async_session() as session:
-        employees = (
-            await session.execute(
-                select(Employee).where(Employee.status == "approved")
-            )
-        ).scalars().all()
+        has_employees = await session.scalar(
+            select(Employee.id).where(Employee.status == "approved").limit(1)
+        )
 
-        if not employees:
+        if has_employees is None:
             kb = await get_admin_menu(session)
             return await message.answer("❌ Tasdiqlangan ishchilar yo'q.", reply_markup=kb)
 
@@ -699,7 +856,8 @@ async def close_month_handler(message: types.Message, state: FSMContext):
             return await message.answer(
                 f"📋 <b>{current_month}</b> uchun oylik vedomosti yaratildi.\n\n"
                 f"Endi avval <b>\"💵 Oylikni to'lash\"</b> bo'limiga kirib, "
-                f"ishchilarning oyligini birma-bir to'langan deb belgilang.\n\n"
+                f"ishchilarning oyligini to'langan deb belgilang "
+                f"(birma-bir yoki \"✅ Hammasini to'lash\" tugmasi bilan).\n\n"
                 f"<b>Hamma ishchi oyligini olmaguncha oy yopilmaydi.</b>",
                 reply_markup=kb,
                 parse_mode="HTML"
@@ -725,39 +883,16 @@ async def close_month_handler(message: types.Message, state: FSMContext):
             )
 
         # Hamma oylik to'langan bo'lsa, yopamiz
-        for emp in employees:
-            await session.execute(
-                update(KPI)
-                .where(KPI.employee_id == emp.id, KPI.is_closed == False)
-                .values(is_closed=True)
-            )
-
-            await session.execute(
-                update(Advance)
-                .where(Advance.employee_id == emp.id, Advance.is_closed == False)
-                .values(is_closed=True)
-            )
-
-            await session.execute(
-                update(Penalty)
-                .where(Penalty.employee_id == emp.id, Penalty.is_closed == False)
-                .values(is_closed=True)
-            )
-
-        await session.execute(
-            update(SalaryHistory)
-            .where(
-                SalaryHistory.month == current_month,
-                SalaryHistory.is_paid == True,
-                SalaryHistory.is_closed == False
-            )
-            .values(
-                is_closed=True,
-                closed_at=datetime.now()
-            )
-        )
-
+        started = time.perf_counter()
+        closed = await close_ledger_month(session, current_month)
         await session.commit()
+        bump_ledger_version()
+        logger.info(
+            "%s oyi yopildi: %.1f ms, premiya %s, avans %s, jarima %s, oylik %s qator",
+            current_month,
+            (time.perf_counter() - started) * 1000,
+            closed["kpi"], closed["advance"], closed["penalty"], closed["salary"]
+        )
         kb = await get_admin_menu(session)
 
     await message.answer(
@@ -766,3 +901,44 @@ async def close_month_handler(message: types.Message, state: FSMContext):
         reply_markup=kb,
         parse_mode="HTML"
     )
+
+
+# =========================
+# 8) BALANS JADVALINI TEKSHIRISH
+# =========================
+@admin_router.message(Command("verify_balances"))
+@query_budget(1)
+async def verify_balances_handler(message: types.Message):
+    async with async_session() as session:
+        mismatches = await verify_employee_balances(session)
+
+    if not mismatches:
+        return await message.answer("✅ Balans jadvali ledger bilan mos keladi.")
+
+    # Har bir ustun alohida: faqat bitta ustun farq qilsa ham ko'rinadi
+    labels = ("KPI", "Avans", "Jarima")
+    lines = "\n".join(
+        f"• {emp_id}: " + "; ".join(
+            f"{label} saqlangan {fmt_money(old)}, haqiqiy {fmt_money(new)}"
+            for label, old, new in zip(labels, saved, actual)
+            if abs(old - new) > 0.005
+        )
+        for emp_id, saved, actual in mismatches[:20]
+    )
+    await message.answer(
+        f"⚠️ <b>{len(mismatches)} ta ishchi balansi ledgerdan farq qiladi:</b>\n\n"
+        f"{lines}\n\n"
+        f"Qayta hisoblash uchun /rebuild_balances buyrug'ini yuboring.",
+        parse_mode="HTML"
+    )
+
+
+@admin_router.message(Command("rebuild_balances"))
+@query_budget(3)
+async def rebuild_balances_handler(message: types.Message):
+    async with async_session() as session:
+        rebuilt = await rebuild_employee_balances(session)
+        await session.commit()
+    bump_ledger_version()
+
+    await message.answer(f"✅ Balans jadvali ledgerdan qayta hisoblandi ({rebuilt} ta ishchi).")
@@ -0,0 +1,307 @@
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import select, union_all, literal, func, update, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from database import Employee, KPI, Advance, Penalty, EmployeeBalance, SalaryHistory, current_period
+
+BALANCE_COLUMNS = {
+    "kpi": "total_kpi",
+    "advance": "total_advance",
+    "penalty": "total_penalty",
+}
+
+
+# =========================
+# LEDGER BO'YICHA HISOBLASH
+# =========================
+LEDGER_MODELS = ((KPI, "kpi"), (Advance, "advance"), (Penalty, "penalty"))
+
+
+def _ledger_union(filters, with_period: bool = False):
+    # filters(model) - har bir ledger jadvali uchun WHERE shartlari ro'yxati
+    parts = []
+    for model, column in LEDGER_MODELS:
+        query = select(
+            model.employee_id.label("employee_id"),
+            *([model.period.label("period")] if with_period else []),
+            *(
+                (model.amount if name == column else literal(0.0)).label(name)
+                for name in ("kpi", "advance", "penalty")
+            )
+        ).where(*filters(model))
+        parts.append(query)
+
+    return union_all(*parts).subquery()
+
+
+def _open_ledger_totals(emp_ids: Optional[Iterable[int]] = None):
+    def filters(model):
+        conditions = [model.is_closed == False]
+        if emp_ids is not None:
+            conditions.append(model.employee_id.in_(emp_ids))
+        return conditions
+
+    ledger = _ledger_union(filters)
+
+    return (
+        select(
+            ledger.c.employee_id,
+            func.sum(ledger.c.kpi).label("kpis"),
+            func.sum(ledger.c.advance).label("advances"),
+            func.sum(ledger.c.penalty).label("penalties"),
+        )
+        .group_by(ledger.c.employee_id)
+        .subquery()
+    )
+
+
+# =========================
+# OYLAR BO'YICHA (PERIOD)
+# =========================
+def period_totals_query(emp_id: int, start: Optional[str] = None, end: Optional[str] = None):
+    # (employee_id, period) indeksi bo'yicha oraliq qidiruv; start/end - "YYYY-MM", ikkalasi ham kiradi
+    def filters(model):
+        conditions = [model.employee_id == emp_id]
+        if start is not None:
+            conditions.append(model.period >= start)
+        if end is not None:
+            conditions.append(model.period <= end)
+        return conditions
+
+    ledger = _ledger_union(filters, with_period=True)
+
+    return (
+        select(
+            ledger.c.period,
+            func.sum(ledger.c.kpi).label("kpis"),
+            func.sum(ledger.c.advance).label("advances"),
+            func.sum(ledger.c.penalty).label("penalties"),
+        )
+        .group_by(ledger.c.period)
+        .order_by(ledger.c.period.desc())
+    )
+
+
+async def get_monthly_totals(session, emp_id: int, start: Optional[str] = None, end: Optional[str] = None):
+    rows = await session.execute(period_totals_query(emp_id, start, end))
+    return [
+        {"period": period, "kpis": kpis, "advances": advances, "penalties": penalties}
+        for period, kpis, advances, penalties in rows.all()
+    ]
+
+
+def year_to_date_query(emp_id: int, year: str):
+    # Yopilgan oylar bo'yicha bitta agregat so'rov, (employee_id, month) indeksi oralig'ida
+    return select(
+        func.count(),
+        func.coalesce(func.sum(SalaryHistory.total_kpi), 0),
+        func.coalesce(func.sum(SalaryHistory.total_advance), 0),
+        func.coalesce(func.sum(SalaryHistory.total_penalty), 0),
+        func.coalesce(func.sum(SalaryHistory.final_salary), 0),
+    ).where(
+        SalaryHistory.employee_id == emp_id,
+        SalaryHistory.month >= f"{year}-01",
+        SalaryHistory.month <= f"{year}-12",
+        SalaryHistory.is_closed == True
+    )
+
+
+async def get_year_to_date_totals(session, emp_id: int, year: Optional[str] = None):
+    year = year or current_period()[:4]
+    months, kpis, advances, penalties, salaries = (await session.execute(year_to_date_query(emp_id, year))).one()
+    return {
+        "year": year,
+        "months": months,
+        "kpis": kpis,
+        "advances": advances,
+        "penalties": penalties,
+        "salaries": salaries,
+    }
+
+
+# =========================
+# BALANS JADVALIDAN O'QISH
+# =========================
+def balance_query(emp_ids: Optional[Iterable[int]] = None, status: Optional[str] = None):
+    query = (
+        select(
+            Employee,
+            func.coalesce(EmployeeBalance.total_kpi, 0.0).label("kpis"),
+            func.coalesce(EmployeeBalance.total_advance, 0.0).label("advances"),
+            func.coalesce(EmployeeBalance.total_penalty, 0.0).label("penalties"),
+        )
+        .outerjoin(EmployeeBalance, EmployeeBalance.employee_id == Employee.id)
+    )
+    if emp_ids is not None:
+        query = query.where(Employee.id.in_(list(emp_ids)))
+    if status is not None:
+        query = query.where(Employee.status == status)
+
+    return query
+
+
+async def get_balances(session, emp_ids: Optional[Iterable[int]] = None, status: Optional[str] = None):
+    rows = await session.execute(balance_query(emp_ids, status))
+
+    balances = {}
+    for emp, kpis, advances, penalties in rows.all():
+        balances[emp.id] = {
+            "employee": emp,
+            "kpis": kpis,
+            "advances": advances,
+            "penalties": penalties,
+            "current_balance": emp.base_salary + kpis - advances - penalties
+        }
+
+    return balances
+
+
+async def get_employee_balance(session, emp_id: int):
+    return (await get_balances(session, [emp_id])).get(emp_id)
+
+
+# =========================
+# BALANS JADVALINI YANGILASH
+# =========================
+async def apply_ledger_entry(session, emp_id: int, action_type: str, amount: float):
+    # Ledgerga yozuv qo'shilgan tranzaksiya ichida chaqiriladi
+    column = BALANCE_COLUMNS[action_type]
+    now = datetime.utcnow()
+
+    values = {name: 0.0 for name in BALANCE_COLUMNS.values()}
+    values[column] = amount
+
+    stmt = insert(EmployeeBalance).values(
+        employee_id=emp_id,
+        version=1,
+        updated_at=now,
+        **values
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[EmployeeBalance.employee_id],
+        set_={
+            column: getattr(EmployeeBalance, column) + amount,
+            "version": EmployeeBalance.version + 1,
+            "updated_at": now,
+        }
+    )
+    await session.execute(stmt)
+
+
+async def reset_open_balances(session, emp_ids: Optional[Iterable[int]] = None):
+    stmt = update(EmployeeBalance).values(
+        total_kpi=0.0,
+        total_advance=0.0,
+        total_penalty=0.0,
+        version=EmployeeBalance.version + 1,
+        updated_at=datetime.utcnow()
+    )
+    if emp_ids is not None:
+        stmt = stmt.where(EmployeeBalance.employee_id.in_(list(emp_ids)))
+    await session.execute(stmt)
+
+
+def open_totals_update_query():
+    # Hali ochiq yozuvlari bor ishchilarning balansini shu yozuvlardan qayta yozadi (UPDATE ... FROM)
+    totals = _open_ledger_totals()
+    return (
+        update(EmployeeBalance)
+        .where(EmployeeBalance.employee_id == totals.c.employee_id)
+        .values(
+            total_kpi=totals.c.kpis,
+            total_advance=totals.c.advances,
+            total_penalty=totals.c.penalties
+        )
+    )
+
+
+async def rebuild_employee_balances(session):
+    # Versiyalar kamaymasligi uchun yangi qatorlar eng katta versiyadan davom etadi
+    max_version = await session.scalar(select(func.max(EmployeeBalance.version))) or 0
+    totals = _open_ledger_totals()
+
+    await session.execute(delete(EmployeeBalance))
+    result = await session.execute(
+        insert(EmployeeBalance).from_select(
+            ["employee_id", "total_kpi", "total_advance", "total_penalty", "version", "updated_at"],
+            select(
+                totals.c.employee_id,
+                totals.c.kpis,
+                totals.c.advances,
+                totals.c.penalties,
+                literal(max_version + 1),
+                literal(datetime.utcnow()),
+            )
+        )
+    )
+    return result.rowcount
+
+
+async def verify_employee_balances(session):
+    totals = _open_ledger_totals()
+    stored = EmployeeBalance
+
+    rows = await session.execute(
+        select(
+            Employee.id,
+            func.coalesce(stored.total_kpi, 0.0),
+            func.coalesce(stored.total_advance, 0.0),
+            func.coalesce(stored.total_penalty, 0.0),
+            func.coalesce(totals.c.kpis, 0.0),
+            func.coalesce(totals.c.advances, 0.0),
+            func.coalesce(totals.c.penalties, 0.0),
+        )
+        .outerjoin(stored, stored.employee_id == Employee.id)
+        .outerjoin(totals, totals.c.employee_id == Employee.id)
+    )
+
+    mismatches = []
+    for emp_id, *values in rows.all():
+        saved, actual = values[:3], values[3:]
+        if any(abs(a - b) > 0.005 for a, b in zip(saved, actual)):
+            mismatches.append((emp_id, tuple(saved), tuple(actual)))
+
+    return mismatches
+
+
+# =========================
+# OYNI YOPISH
+# =========================
+def close_ledger_query(model):
+    # ix_*_open qisman indeksi faqat ochiq qatorlarni saqlaydi, shuning uchun ledger qancha
+    # o'smasin, faqat yopilayotgan qatorlar o'qiladi
+    return update(model).where(model.is_closed == False).values(is_closed=True)
+
+
+def close_salary_query(month: str):
+    return (
+        update(SalaryHistory)
+        .where(
+            SalaryHistory.month == month,
+            SalaryHistory.is_paid == True,
+            SalaryHistory.is_closed == False
+        )
+        .values(is_closed=True, closed_at=datetime.now())
+    )
+
+
+async def close_ledger_month(session, month: str) -> dict:
+    # Ishchilar soniga bog'liq bo'lmagan bir nechta umumiy UPDATE; commit'ni chaqiruvchi qiladi,
+    # shuning uchun hammasi SalaryHistory yopilishi bilan bitta tranzaksiyada bajariladi.
+    # Oy o'rtasida chetlatilgan ishchilarning ochiq yozuvlari ham yopiladi.
+    closed = {}
+    for model, name in LEDGER_MODELS:
+        result = await session.execute(close_ledger_query(model))
+        closed[name] = result.rowcount
+
+    # Balans yopish bilan bir xil predikatdan olinadi: nolga tushiriladi, so'ng yopilmay qolgan
+    # yozuvlar (bo'lsa) qaytadan qo'shiladi - hisobda turgan qatorlar balansdan tushib qolmaydi
+    await reset_open_balances(session)
+    await session.execute(open_totals_update_query())
+
+    result = await session.execute(close_salary_query(month))
+    closed["salary"] = result.rowcount
+
+    return closed
@@ -0,0 +1,787 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, select, func, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import (
+    Base,
+    Employee,
+    KPI,
+    Advance,
+    Penalty,
+    SalaryHistory,
+    MIGRATIONS,
+    SQLITE_PRAGMAS,
+    create_engine_with_profile,
+    current_period,
+)
+from balance import apply_ledger_entry, get_employee_balance, reset_open_balances, close_ledger_month
+
+BENCH_EMP_ID = 1
+
+
+# =========================
+# YORDAMCHI FUNKSIYALAR
+# =========================
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies) -> dict:
+    return {
+        "count": len(latencies),
+        "total_s": round(sum(latencies), 4),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def emit(results: dict, output: str = None):
+    payload = json.dumps(results, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    print(payload)
+
+
+def peak_rss_mb() -> float:
+    # Linux'da ru_maxrss kilobaytda
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# =========================
+# SINTETIK BAZA
+# =========================
+def _months_back(period: str, count: int) -> list:
+    # "2026-03", 2 -> ["2026-02", "2026-01"]
+    year, month = map(int, period.split("-"))
+    months = []
+    for _ in range(count):
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        months.append(f"{year:04d}-{month:02d}")
+    return months
+
+
+def seed_database(path: str, employees: int, entries: int = 3, months: int = 0, seed: int = 42):
+    # entries - har bir ishchi uchun kpi/advances/penalties jadvallarining har biriga bir oydagi yozuvlar soni;
+    # joriy oy yozuvlari ochiq, months ta o'tgan oy esa yopilgan va SalaryHistory'da to'langan
+    rng = random.Random(seed)
+    now = datetime.utcnow().isoformat(sep=" ")
+    period = current_period()
+    past_periods = _months_back(period, months)
+
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    base_salaries = [float(rng.randrange(2_000_000, 12_000_000, 50_000)) for _ in range(employees)]
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO employees (id, full_name, phone, role, status, salary_type, base_salary, created_at) "
+            "VALUES (?, ?, ?, 'worker', 'approved', ?, ?, ?)",
+            (
+                (
+                    1_000_000 + i,
+                    f"Ishchi {i:06d}",
+                    f"+99890{i:07d}",
+                    "Fix" if i % 3 else "KPI",
+                    base_salaries[i],
+                    now,
+                )
+                for i in range(employees)
+            )
+        )
+
+        # (employee_index, period) -> [kpi, advance, penalty] - o'tgan oylar vedomosti uchun
+        totals = {}
+
+        for column, (table, text_column) in enumerate(
+            (("kpi", "description"), ("advances", "description"), ("penalties", "reason"))
+        ):
+            for month_period in [period] + past_periods:
+                is_closed = int(month_period != period)
+                created_at = now if not is_closed else f"{month_period}-15 12:00:00"
+                rows = []
+                for i in range(employees):
+                    for _ in range(entries):
+                        amount = float(rng.randrange(10_000, 500_000, 1_000))
+                        rows.append((1_000_000 + i, amount, "benchmark", month_period, is_closed, created_at))
+                        if is_closed:
+                            totals.setdefault((i, month_period), [0.0, 0.0, 0.0])[column] += amount
+
+                conn.executemany(
+                    f"INSERT INTO {table} (employee_id, amount, {text_column}, period, is_closed, created_at) "
+                    f"VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+
+        conn.executemany(
+            "INSERT INTO salary_history (employee_id, month, total_kpi, total_advance, total_penalty, final_salary, "
+            "is_paid, paid_at, is_closed, closed_at, created_at) VALUES (?, ?, ?, ?, ?, ?, 1, ?, 1, ?, ?)",
+            (
+                (
+                    1_000_000 + i,
+                    month_period,
+                    kpis,
+                    advances,
+                    penalties,
+                    base_salaries[i] + kpis - advances - penalties,
+                    f"{month_period}-28 12:00:00",
+                    f"{month_period}-28 12:00:00",
+                    f"{month_period}-28 12:00:00",
+                )
+                for (i, month_period), (kpis, advances, penalties) in totals.items()
+            )
+        )
+
+        conn.execute(
+            "INSERT INTO employee_balances (employee_id, total_kpi, total_advance, total_penalty, version, updated_at) "
+            "SELECT employee_id, SUM(k), SUM(a), SUM(p), 1, ? FROM ("
+            "  SELECT employee_id, amount AS k, 0 AS a, 0 AS p FROM kpi WHERE is_closed = 0"
+            "  UNION ALL SELECT employee_id, 0, amount, 0 FROM advances WHERE is_closed = 0"
+            "  UNION ALL SELECT employee_id, 0, 0, amount FROM penalties WHERE is_closed = 0"
+            ") GROUP BY employee_id",
+            (now,)
+        )
+
+        conn.executemany(
+            "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+            ((version, now) for version in range(1, len(MIGRATIONS) + 1))
+        )
+    conn.close()
+
+
+# =========================
+# COMMIT LATENCY (PRAGMA PROFILLARI)
+# =========================
+async def _commit_run(url: str, pragmas: dict, commits: int, readers: int) -> dict:
+    db_engine = create_engine_with_profile(url, pragmas)
+    session_maker = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with session_maker() as session:
+        session.add(Employee(id=BENCH_EMP_ID, full_name="Benchmark", phone="+998000000000", status="approved"))
+        await session.commit()
+
+    done = asyncio.Event()
+    reads = 0
+
+    async def reader():
+        nonlocal reads
+        while not done.is_set():
+            async with session_maker() as session:
+                await get_employee_balance(session, BENCH_EMP_ID)
+            reads += 1
+            await asyncio.sleep(0)
+
+    reader_tasks = [asyncio.create_task(reader()) for _ in range(readers)]
+
+    latencies = []
+    for i in range(commits):
+        started = time.perf_counter()
+        async with session_maker() as session:
+            session.add(KPI(employee_id=BENCH_EMP_ID, amount=1000, description=f"bench {i}"))
+            await apply_ledger_entry(session, BENCH_EMP_ID, "kpi", 1000)
+            await session.commit()
+        latencies.append(time.perf_counter() - started)
+
+    done.set()
+    await asyncio.gather(*reader_tasks)
+    await db_engine.dispose()
+
+    result = summarize(latencies)
+    result["reads"] = reads
+    return result
+
+
+async def bench_commit(args) -> dict:
+    profiles = {
+        "sqlite_default": {},
+        "tuned": SQLITE_PRAGMAS,
+    }
+
+    results = {}
+    for name, pragmas in profiles.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+            results[name] = await _commit_run(url, pragmas, args.commits, args.readers)
+        results[name]["pragmas"] = pragmas
+
+    return {"benchmark": "commit", "commits": args.commits, "readers": args.readers, "results": results}
+
+
+# =========================
+# EXCEL EKSPORT (PEAK RSS)
+# =========================
+def _export_worker() -> dict:
+    # Alohida jarayonda ishlaydi: peak RSS faqat hisobot yaratishni o'lchaydi
+    from reports import render_report
+
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    report = render_report()
+    elapsed = time.perf_counter() - started
+
+    size = len(report.data) if report.data is not None else os.path.getsize(report.path)
+    spilled = report.path is not None
+    report.cleanup()
+
+    return {
+        "wall_s": round(elapsed, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_before_mb": rss_before,
+        "file_bytes": size,
+        "spilled_to_disk": spilled,
+    }
+
+
+def bench_export(args) -> dict:
+    results = {}
+    for employees in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            seed_database(path, employees, entries=args.entries)
+
+            env = dict(os.environ, DB_URL=f"sqlite+aiosqlite:///{path}")
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "export-worker"],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            results[str(employees)] = json.loads(proc.stdout)
+
+    return {"benchmark": "export", "results": results}
+
+
+# =========================
+# OYNI YOPISH
+# =========================
+BENCH_MONTH = current_period()
+
+
+def _prepare_close_database(path: str, employees: int, entries: int, fired: float):
+    seed_database(path, employees, entries=entries)
+
+    conn = sqlite3.connect(path)
+    with conn:
+        # Vedomost to'liq to'langan, bir qism ishchilar oy o'rtasida chetlatilgan
+        conn.execute(
+            "INSERT INTO salary_history (employee_id, month, total_kpi, total_advance, total_penalty, "
+            "final_salary, is_paid, paid_at, is_closed, created_at) "
+            "SELECT id, ?, 0, 0, 0, base_salary, 1, created_at, 0, created_at FROM employees",
+            (BENCH_MONTH,)
+        )
+        step = max(1, round(1 / fired)) if fired > 0 else 0
+        if step:
+            conn.execute("UPDATE employees SET status = 'fired' WHERE id % ? = 0", (step,))
+    conn.close()
+
+
+async def _close_legacy(session, month: str):
+    # Avvalgi usul: har bir tasdiqlangan ishchi uchun uchta UPDATE
+    employees = (
+        await session.execute(select(Employee).where(Employee.status == "approved"))
+    ).scalars().all()
+
+    for emp in employees:
+        for model in (KPI, Advance, Penalty):
+            await session.execute(
+                update(model)
+                .where(model.employee_id == emp.id, model.is_closed == False)
+                .values(is_closed=True)
+            )
+
+    await reset_open_balances(session, [emp.id for emp in employees])
+    await session.execute(
+        update(SalaryHistory)
+        .where(SalaryHistory.month == month, SalaryHistory.is_paid == True, SalaryHistory.is_closed == False)
+        .values(is_closed=True, closed_at=datetime.now())
+    )
+
+
+async def _close_run(path: str, strategy) -> dict:
+    db_engine = create_engine_with_profile(f"sqlite+aiosqlite:///{path}")
+    session_maker = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+
+    statements = 0
+
+    def count_statement(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    started = time.perf_counter()
+    async with session_maker() as session:
+        await strategy(session, BENCH_MONTH)
+        await session.commit()
+    elapsed = time.perf_counter() - started
+
+    async with session_maker() as session:
+        open_rows = 0
+        for model in (KPI, Advance, Penalty):
+            open_rows += await session.scalar(
+                select(func.count()).select_from(model).where(model.is_closed == False)
+            )
+    await db_engine.dispose()
+
+    return {
+        "wall_s": round(elapsed, 3),
+        "statements": statements,
+        "open_ledger_rows_left": open_rows,
+    }
+
+
+async def bench_close(args) -> dict:
+    # rows - uchala ledger jadvalidagi jami ochiq yozuvlar soni
+    entries = max(1, -(-args.rows // (3 * args.employees)))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        _prepare_close_database(template, args.employees, entries, args.fired)
+
+        strategies = {"set_based": close_ledger_month}
+        if not args.skip_legacy:
+            strategies["per_employee"] = _close_legacy
+
+        for name, strategy in strategies.items():
+            path = os.path.join(tmp, f"{name}.db")
+            shutil.copyfile(template, path)
+            results[name] = await _close_run(path, strategy)
+
+    return {
+        "benchmark": "close",
+        "employees": args.employees,
+        "ledger_rows": entries * 3 * args.employees,
+        "fired_share": args.fired,
+        "results": results,
+    }
+
+
+# =========================
+# OYLIK HISOB-KITOB AMALLARI
+# =========================
+async def _payroll_run(sample: int, seed: int) -> dict:
+    # Alohida jarayonda ishlaydi: modullar DB_URL'ni import paytida o'qiydi
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    import admin
+    from database import async_session
+    from bot import create_bot, build_dispatcher
+    from fake_telegram import FakeTelegramSession, FAKE_TOKEN, make_message_update, make_callback_update
+    from jobs import report_queue
+
+    session_stub = FakeTelegramSession()
+    bot = create_bot(FAKE_TOKEN, session=session_stub)
+    dp = build_dispatcher(storage=MemoryStorage())
+    month = current_period()
+
+    async with async_session() as session:
+        emp_ids = (
+            await session.scalars(
+                select(Employee.id).where(Employee.status == "approved").order_by(Employee.id)
+            )
+        ).all()
+    ids = random.Random(seed).sample(emp_ids, min(sample, len(emp_ids)))
+
+    results = {}
+
+    latencies = []
+    for emp_id in ids:
+        started = time.perf_counter()
+        async with async_session() as session:
+            await admin.calculate_employee_balance(session, emp_id)
+        latencies.append(time.perf_counter() - started)
+    results["calculate_employee_balance"] = summarize(latencies)
+
+    latencies = []
+    for emp_id in ids:
+        update = make_callback_update(emp_id, "salary_history")
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        latencies.append(time.perf_counter() - started)
+    results["show_salary_history"] = summarize(latencies)
+
+    started = time.perf_counter()
+    async with async_session() as session:
+        created = await admin.get_or_create_salary_sheet_for_month(session, month)
+    create_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    async with async_session() as session:
+        await admin.get_or_create_salary_sheet_for_month(session, month)
+    existing_s = time.perf_counter() - started
+
+    results["get_or_create_salary_sheet_for_month"] = {
+        "rows_created": created,
+        "create_s": round(create_s, 4),
+        "existing_s": round(existing_s, 4),
+    }
+
+    # Birinchi eksport ishchi jarayonlarni ham ishga tushiradi, ikkinchisi - odatiy holat
+    export = {}
+    for run in ("first", "warm"):
+        message = make_message_update(admin.ADMIN_ID, "📥 Umumiy hisobot").message.as_(bot)
+        started = time.perf_counter()
+        job_id = await admin.export_excel_logic(message)
+        await report_queue.wait(job_id)
+        export[f"{run}_s"] = round(time.perf_counter() - started, 4)
+    export["documents_sent"] = session_stub.counts().get("SendDocument", 0)
+    results["export_excel_logic"] = export
+
+    async with async_session() as session:
+        await admin.pay_all_salaries(session, month)
+        await session.commit()
+
+    started = time.perf_counter()
+    await dp.feed_update(bot, make_message_update(admin.ADMIN_ID, "📊 Oylik yopish"))
+    close_s = time.perf_counter() - started
+
+    async with async_session() as session:
+        open_rows = 0
+        for model in (KPI, Advance, Penalty):
+            open_rows += await session.scalar(
+                select(func.count()).select_from(model).where(model.is_closed == False)
+            )
+    results["close_month_handler"] = {"wall_s": round(close_s, 4), "open_ledger_rows_left": open_rows}
+
+    await report_queue.shutdown()
+    await bot.session.close()
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return proc.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _best_results(runs: list):
+    # Takroriy yugurishlar: vaqt ko'rsatkichlari bo'yicha eng yaxshisi (minimum) - fon yuklamasi va
+    # keshlar faqat sekinlashtiradi; qolgan qiymatlar birinchi yugurishdan
+    first = runs[0]
+    if isinstance(first, dict):
+        return {key: _best_results([run[key] for run in runs]) for key in first}
+    if isinstance(first, float):
+        return min(runs)
+    return first
+
+
+def bench_payroll(args) -> dict:
+    if args.db and os.path.exists(args.db):
+        raise SystemExit(f"{args.db} allaqachon mavjud - boshqa yo'l ko'rsating yoki faylni o'chiring")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "company_kpi.db")
+
+        started = time.perf_counter()
+        seed_database(path, args.employees, entries=args.entries, months=args.months, seed=args.seed)
+        seed_s = time.perf_counter() - started
+
+        # Har bir yugurish oyni yopadi, shuning uchun bir xil boshlang'ich bazaning nusxasida ishlaydi
+        runs = []
+        for run in range(args.repeat):
+            run_path = os.path.join(tmp, f"run_{run}.db")
+            shutil.copyfile(path, run_path)
+            env = dict(os.environ, DB_URL=f"sqlite+aiosqlite:///{os.path.abspath(run_path)}", METRICS_PORT="0")
+            proc = subprocess.run(
+                [
+                    sys.executable, os.path.abspath(__file__), "payroll-worker",
+                    "--sample", str(args.sample), "--seed", str(args.seed),
+                ],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    return {
+        "benchmark": "payroll",
+        "commit": _git_commit(),
+        "params": {
+            "employees": args.employees,
+            "entries_per_month": args.entries,
+            "months": args.months,
+            "sample": args.sample,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "seed_s": round(seed_s, 3),
+        "results": _best_results(runs),
+    }
+
+
+# =========================
+# NATIJALARNI SOLISHTIRISH
+# =========================
+def _timings(data, prefix: str = "") -> dict:
+    # Faqat vaqt ko'rsatkichlari (*_s, *_ms) solishtiriladi
+    found = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            name = f"{prefix}.{key}" if prefix else key
+            if isinstance(value, dict):
+                found.update(_timings(value, name))
+            elif isinstance(value, (int, float)) and (key.endswith("_s") or key.endswith("_ms")):
+                found[name] = value
+    return found
+
+
+# Dum (p95/p99/max) va o'rtacha bitta sekin so'rovdan sakraydi - regressiya p50 va umumiy vaqtdan baholanadi
+NOISY_TIMINGS = ("mean_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+def _as_ms(name: str, value: float) -> float:
+    return value * 1000 if name.endswith("_s") else value
+
+
+def compare_results(base_path: str, new_path: str, threshold: float, floor_ms: float) -> int:
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+
+    base_timings = _timings(base.get("results", base))
+    new_timings = _timings(new.get("results", new))
+
+    print(f"{base.get('commit', base_path)} -> {new.get('commit', new_path)}")
+    # Har xil parametrlar bilan olingan natijalar nisbati regressiya haqida hech narsa demaydi
+    base_params, new_params = base.get("params"), new.get("params")
+    if base_params != new_params:
+        print(f"DIQQAT: parametrlar farq qiladi: {base_params} != {new_params}")
+    print(f"{'metrika':<58}{'oldin':>12}{'keyin':>12}{'nisbat':>9}")
+
+    regressions = []
+    for name in sorted(base_timings.keys() & new_timings.keys()):
+        if name.endswith(NOISY_TIMINGS):
+            continue
+        old, current = base_timings[name], new_timings[name]
+        ratio = current / old if old else float("inf") if current else 1.0
+        mark = ""
+        if ratio > threshold:
+            # Bir necha millisekundlik farq - o'lchash shovqini, kichik bazada nisbat katta ko'rinsa ham
+            if _as_ms(name, current) - _as_ms(name, old) < floor_ms:
+                mark = "  (shovqin chegarasidan past)"
+            else:
+                mark = "  <-- sekinlashdi"
+                regressions.append(name)
+        print(f"{name:<58}{old:>12g}{current:>12g}{ratio:>9.2f}{mark}")
+
+    if regressions:
+        print(f"\n{len(regressions)} ta metrika {threshold}x dan ko'proq sekinlashdi.")
+        return 1
+    return 0
+
+
+# =========================
+# ISHGA TUSHISH VAQTI
+# =========================
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "reports")
+
+
+def _startup_worker() -> dict:
+    # bot.main() to'liq yo'lidan o'tadi, faqat tarmoq chaqiruvlari almashtiriladi
+    started = time.perf_counter()
+    import bot
+    imported = time.perf_counter()
+
+    from aiogram import Bot, Dispatcher
+
+    marks = {}
+
+    async def delete_webhook(self, *args, **kwargs):
+        return True
+
+    async def start_polling(self, *args, **kwargs):
+        marks["first_poll"] = time.perf_counter()
+
+    Bot.delete_webhook = delete_webhook
+    Dispatcher.start_polling = start_polling
+
+    asyncio.run(bot.main())
+
+    return {
+        "import_ms": round((imported - started) * 1000, 1),
+        "time_to_first_poll_ms": round((marks["first_poll"] - started) * 1000, 1),
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+
+
+def _import_breakdown(env: dict, top: int) -> list:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Har bir ichma-ich daraja 2 ta bo'sh joy: bot va uning bevosita importlari olinadi
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1:
+            continue
+        modules.append((name.strip(), int(cumulative) / 1000))
+
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in modules[:top]]
+
+
+def bench_startup(args) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_URL=f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}",
+            BOT_TOKEN=os.getenv("BOT_TOKEN", "123456:benchmark"),
+        )
+
+        # Birinchi ishga tushish sxemani yaratadi, ikkinchisi - odatiy (warm) restart
+        for run in ("cold", "warm"):
+            started = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "startup-worker"],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            result["process_wall_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            results[run] = result
+
+        results["imports"] = _import_breakdown(env, args.top)
+
+    warm = results["warm"]
+    violations = []
+    if warm["time_to_first_poll_ms"] > args.budget_ms:
+        violations.append(f"time_to_first_poll {warm['time_to_first_poll_ms']} ms > {args.budget_ms} ms")
+    if warm["heavy_modules_loaded"]:
+        violations.append(f"heavy modules imported at startup: {', '.join(warm['heavy_modules_loaded'])}")
+
+    return {
+        "benchmark": "startup",
+        "budget_ms": args.budget_ms,
+        "violations": violations,
+        "results": results,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Payroll bot benchmarklari")
+    parser.add_argument("--output", help="Natijani JSON faylga yozish")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    commit_parser = sub.add_parser("commit", help="Commit latency: SQLite default vs sozlangan profil")
+    commit_parser.add_argument("--commits", type=int, default=500)
+    commit_parser.add_argument("--readers", type=int, default=4)
+
+    export_parser = sub.add_parser("export", help="Excel eksport: vaqt va peak RSS")
+    export_parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    export_parser.add_argument("--entries", type=int, default=3)
+
+    sub.add_parser("export-worker", help=argparse.SUPPRESS)
+
+    close_parser = sub.add_parser("close", help="Oyni yopish: umumiy UPDATE vs har bir ishchi uchun")
+    close_parser.add_argument("--employees", type=int, default=10_000)
+    close_parser.add_argument("--rows", type=int, default=1_000_000)
+    close_parser.add_argument("--fired", type=float, default=0.05, help="Oy o'rtasida chetlatilganlar ulushi")
+    close_parser.add_argument("--skip-legacy", action="store_true")
+
+    payroll_parser = sub.add_parser("payroll", help="Oylik amallari: balans, vedomost, eksport, oy yopish, tarix")
+    payroll_parser.add_argument("--employees", type=int, default=2_000)
+    payroll_parser.add_argument("--entries", type=int, default=3, help="Har bir jadvalda ishchiga oyiga yozuvlar")
+    payroll_parser.add_argument("--months", type=int, default=6, help="Yopilgan o'tgan oylar (SalaryHistory)")
+    payroll_parser.add_argument("--sample", type=int, default=200, help="Bir ishchili amallar uchun tanlanma")
+    payroll_parser.add_argument("--seed", type=int, default=42)
+    payroll_parser.add_argument("--db", help="Sintetik bazani shu faylga saqlash (mavjud bo'lmasligi kerak)")
+    payroll_parser.add_argument("--repeat", type=int, default=5, help="Yugurishlar soni; vaqtlar - eng yaxshisi")
+
+    payroll_worker_parser = sub.add_parser("payroll-worker", help=argparse.SUPPRESS)
+    payroll_worker_parser.add_argument("--sample", type=int, default=200)
+    payroll_worker_parser.add_argument("--seed", type=int, default=42)
+
+    compare_parser = sub.add_parser("compare", help="Ikki JSON natijani solishtirish (commitlar orasida)")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=1.2, help="Shundan katta nisbat - regressiya")
+    compare_parser.add_argument("--floor-ms", type=float, default=10.0, help="Bundan kichik sekinlashish hisobga olinmaydi")
+
+    startup_parser = sub.add_parser("startup", help="Import vaqti va time-to-first-poll (budjet bilan)")
+    startup_parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "4000")))
+    startup_parser.add_argument("--top", type=int, default=15)
+
+    sub.add_parser("startup-worker", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.command == "commit":
+        results = asyncio.run(bench_commit(args))
+    elif args.command == "export":
+        results = bench_export(args)
+    elif args.command == "export-worker":
+        print(json.dumps(_export_worker()))
+        return 0
+    elif args.command == "close":
+        results = asyncio.run(bench_close(args))
+    elif args.command == "payroll":
+        results = bench_payroll(args)
+    elif args.command == "payroll-worker":
+        print(json.dumps(asyncio.run(_payroll_run(args.sample, args.seed))))
+        return 0
+    elif args.command == "compare":
+        return compare_results(args.base, args.new, args.threshold, args.floor_ms)
+    elif args.command == "startup":
+        results = bench_startup(args)
+    elif args.command == "startup-worker":
+        print(json.dumps(_startup_worker()))
+        return 0
+
+    emit(results, args.output)
+    return 1 if results.get("violations") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,13 +7,22 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from database import init_db, migrate_db
+from database import engine, init_db
+from cache import employee_directory, rendered_responses
+from jobs import report_queue
+from outbox import NotificationDispatcher
+from storage import SQLiteStorage
+from metrics import install_metrics, instrument_engine, register_collector, start_metrics_server
+from throttling import install_throttling, user_buckets
+from webhook import run_webhook
+from workers import BOT_WORKERS, run_workers
 from admin import admin_router
 from user import user_router
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT_RUN_MODE = os.getenv("BOT_RUN_MODE", "polling")  # polling / webhook
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,39 +31,81 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def create_bot(token: str, session=None) -> Bot:
+    return Bot(
+        token=token,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+
+
+def build_dispatcher(storage=None) -> Dispatcher:
+    # FSM holatlari bazada saqlanadi - qayta ishga tushganda yarim qolgan jarayonlar yo'qolmaydi
+    dp = Dispatcher(storage=storage or SQLiteStorage())
+
+    dp.include_router(admin_router)
+    dp.include_router(user_router)
+
+    install_metrics(admin_router, user_router)
+    instrument_engine(engine)
+    # Faqat ishchilar: admin cheklanmaydi
+    install_throttling(user_router)
+
+    return dp
+
+
 async def main():
     if not BOT_TOKEN:
         raise ValueError("❌ BOT_TOKEN topilmadi! .env faylini tekshiring.")
+    if BOT_RUN_MODE not in ("polling", "webhook"):
+        raise ValueError(f"❌ BOT_RUN_MODE noto'g'ri: {BOT_RUN_MODE} (polling yoki webhook bo'lishi kerak)")
 
-    logger.info("🤖 Bot ishga tushirilmoqda...")
+    if BOT_WORKERS > 1:
+        # Update'lar chat bo'yicha BOT_WORKERS ta jarayonga taqsimlanadi (workers.py)
+        logger.info("🤖 Bot ishga tushirilmoqda (%s, %s ta ishchi)...", BOT_RUN_MODE, BOT_WORKERS)
+        return await run_workers(BOT_TOKEN, BOT_WORKERS, BOT_RUN_MODE)
 
-    bot = Bot(
-        token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
+    logger.info("🤖 Bot ishga tushirilmoqda (%s)...", BOT_RUN_MODE)
 
-    dp = Dispatcher()
+    bot = create_bot(BOT_TOKEN)
+    dp = build_dispatcher()
 
-    dp.include_router(admin_router)
-    dp.include_router(user_router)
+    notifier = NotificationDispatcher(bot)
+
+    register_collector("employee_cache", employee_directory.stats)
+    register_collector("response_cache", rendered_responses.stats)
+    register_collector("throttle", user_buckets.stats)
+    register_collector("report_queue", report_queue.stats)
+    register_collector("outbox", notifier.stats)
+    register_collector("fsm", dp.storage.stats)
+    metrics_runner = None
 
     try:
         logger.info("🗄 Ma'lumotlar bazasi tekshirilmoqda...")
         await init_db()
-        await migrate_db()
         logger.info("✅ Ma'lumotlar bazasi tayyor.")
 
-        logger.info("🚀 Polling boshlandi...")
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(
-            bot,
-            allowed_updates=dp.resolve_used_update_types()
-        )
+        notifier.start()
+        metrics_runner = await start_metrics_server()
+
+        if BOT_RUN_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            logger.info("🚀 Polling boshlandi...")
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(
+                bot,
+                allowed_updates=dp.resolve_used_update_types()
+            )
 
     except Exception:
         logger.exception("❌ Bot ishlashida kutilmagan xatolik yuz berdi:")
     finally:
         logger.info("🛑 Bot to'xtatildi. Sessiya yopilmoqda...")
+        await notifier.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await report_queue.shutdown()
         await bot.session.close()
 
 
@@ -0,0 +1,307 @@
+import hashlib
+import html
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import select, func
+
+from database import async_session, Employee
+
+EMPLOYEE_CACHE_SIZE = int(os.getenv("EMPLOYEE_CACHE_SIZE", "10000"))
+EMPLOYEE_CACHE_TTL = float(os.getenv("EMPLOYEE_CACHE_TTL", "300"))  # soniya
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))  # soniya
+
+
+# =========================
+# BOSHQA JARAYONLARGA TARQATISH
+# =========================
+# Ko'p jarayonli rejimda (workers.py) har bir o'zgarish boshqa ishchilarga ham yetkaziladi
+_publisher: Optional[Callable[[str, Optional[int]], None]] = None
+
+
+def set_invalidation_publisher(publish: Optional[Callable[[str, Optional[int]], None]]):
+    global _publisher
+    _publisher = publish
+
+
+def _publish(kind: str, arg: Optional[int] = None):
+    if _publisher is not None:
+        _publisher(kind, arg)
+
+
+def apply_invalidation(kind: str, arg: Optional[int] = None):
+    # Boshqa jarayondan kelgan o'zgarish: faqat mahalliy keshga qo'llanadi, qayta tarqatilmaydi
+    if kind == "roster":
+        bump_roster_version(publish=False)
+    elif kind == "pending":
+        adjust_pending_count(arg, publish=False)
+    elif kind == "employee":
+        employee_directory.invalidate(arg, publish=False)
+    elif kind == "ledger":
+        bump_ledger_version(arg, publish=False)
+
+
+# =========================
+# VERSIYALI KESH
+# =========================
+class VersionedCache:
+    # Kalitlar bitta umumiy versiyaga bog'langan: versiya o'zgarsa, kesh to'liq tozalanadi
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._version = None
+
+    def get(self, key, version):
+        if version != self._version:
+            self._items.clear()
+            self._version = version
+            return None
+
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def set(self, key, version, value):
+        if version != self._version:
+            self._items.clear()
+            self._version = version
+
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+
+# =========================
+# ISHCHILAR RO'YXATI VERSIYASI
+# =========================
+_roster_version = 0
+
+
+def get_roster_version() -> int:
+    return _roster_version
+
+
+def bump_roster_version(publish: bool = True) -> int:
+    # Ro'yxatga ta'sir qiladigan har bir o'zgarishdan keyin chaqiriladi
+    # (ro'yxatdan o'tish, tasdiqlash, chetlatish)
+    global _roster_version
+    _roster_version += 1
+    if publish:
+        _publish("roster")
+    return _roster_version
+
+
+# =========================
+# KUTILAYOTGAN SO'ROVLAR SONI
+# =========================
+_pending_count: Optional[int] = None
+
+
+async def get_pending_count(session=None) -> int:
+    global _pending_count
+    if _pending_count is not None:
+        return _pending_count
+
+    query = select(func.count()).select_from(Employee).where(Employee.status == "pending")
+    if session is None:
+        async with async_session() as session:
+            count = await session.scalar(query)
+    else:
+        count = await session.scalar(query)
+
+    _pending_count = count or 0
+    return _pending_count
+
+
+def adjust_pending_count(delta: int, publish: bool = True):
+    # Son hali o'qilmagan bo'lsa, keyingi so'rovda COUNT bilan olinadi
+    global _pending_count
+    if _pending_count is not None:
+        _pending_count = max(0, _pending_count + delta)
+    if publish:
+        _publish("pending", delta)
+
+
+# =========================
+# ISHCHILAR KATALOGI (LRU + TTL)
+# =========================
+class EmployeeRecord(NamedTuple):
+    id: int
+    full_name: str
+    status: str
+    salary_type: Optional[str]
+    base_salary: float
+
+
+class EmployeeDirectory:
+    def __init__(self, max_size: int = EMPLOYEE_CACHE_SIZE, ttl: float = EMPLOYEE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    async def get(self, emp_id: int, session=None) -> Optional[EmployeeRecord]:
+        item = self._items.get(emp_id)
+        if item is not None:
+            expires_at, record = item
+            if expires_at > time.monotonic():
+                self.hits += 1
+                self._items.move_to_end(emp_id)
+                return record
+            del self._items[emp_id]
+
+        self.misses += 1
+        query = select(
+            Employee.id,
+            Employee.full_name,
+            Employee.status,
+            Employee.salary_type,
+            Employee.base_salary,
+        ).where(Employee.id == emp_id)
+
+        if session is None:
+            async with async_session() as session:
+                row = (await session.execute(query)).first()
+        else:
+            row = (await session.execute(query)).first()
+
+        # Bazada yo'q foydalanuvchi keshlanmaydi - ro'yxatdan o'tgach darhol topilishi kerak
+        if row is None:
+            return None
+
+        record = EmployeeRecord(*row)
+        self._items[emp_id] = (time.monotonic() + self.ttl, record)
+        self._items.move_to_end(emp_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+        return record
+
+    def invalidate(self, emp_id: int, publish: bool = True):
+        self._items.pop(emp_id, None)
+        if publish:
+            _publish("employee", emp_id)
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+employee_directory = EmployeeDirectory()
+
+
+# =========================
+# HISOB-KITOB VERSIYALARI
+# =========================
+_ledger_epoch = 0
+_ledger_versions = {}
+
+
+def get_ledger_version(emp_id: int) -> tuple:
+    return _ledger_epoch, _ledger_versions.get(emp_id, 0)
+
+
+def bump_ledger_version(emp_id: Optional[int] = None, publish: bool = True):
+    # Ishchining balansi, oyliklari yoki ma'lumotlari o'zgargandan keyin chaqiriladi;
+    # emp_id=None - hamma ishchilar (oy yopish, ommaviy to'lov, balanslarni qayta hisoblash)
+    global _ledger_epoch
+    if emp_id is None:
+        _ledger_epoch += 1
+        _ledger_versions.clear()
+    else:
+        _ledger_versions[emp_id] = _ledger_versions.get(emp_id, 0) + 1
+    if publish:
+        _publish("ledger", emp_id)
+
+
+# =========================
+# TAYYOR JAVOBLAR
+# =========================
+_HTML_TAG = re.compile(r"<[^>]+>")
+
+
+def view_key(emp_id: int, view: str) -> tuple:
+    # Versiya kalitning bir qismi: o'zgarishdan keyin eski matn shunchaki topilmaydi
+    return emp_id, view, get_ledger_version(emp_id)
+
+
+def markup_digest(markup) -> Optional[str]:
+    if markup is None:
+        return None
+    payload = json.dumps(markup.model_dump(mode="json", exclude_none=True), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def is_displayed(message, html_text: str, reply_markup=None) -> bool:
+    # Telegram teglarni entity'larga aylantiradi, shuning uchun xabar matni teglarsiz ko'rinish bilan solishtiriladi.
+    # Tugmalar ham solishtiriladi: faqat klaviatura o'zgargan tahrir (masalan, sahifa tugmalari) tashlab ketilmaydi
+    displayed = getattr(message, "text", None)
+    if displayed is None:
+        return False
+    if markup_digest(getattr(message, "reply_markup", None)) != markup_digest(reply_markup):
+        return False
+    return displayed.strip() == html.unescape(_HTML_TAG.sub("", html_text)).strip()
+
+
+class ResponseCache:
+    # (ishchi, ko'rinish, versiya) -> chizilgan matn (yoki matn va tugmalar). TTL boshqa jarayonlardagi o'zgarishlar uchun
+    # sug'urta; TTL hamma uchun bir xil, shuning uchun eng eski yozuvlar doim ro'yxat boshida turadi
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self.hits += 1
+                return value
+            del self._items[key]
+
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        now = time.monotonic()
+        self._items.pop(key, None)
+        self._items[key] = (now + self.ttl, value)
+
+        while self._items:
+            oldest_key, (expires_at, _) = next(iter(self._items.items()))
+            if expires_at > now and len(self._items) <= self.max_size:
+                break
+            del self._items[oldest_key]
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+rendered_responses = ResponseCache()
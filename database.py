@@ -6,19 +6,98 @@ from sqlalchemy import (
     BigInteger,
     ForeignKey,
     String,
+    Text,
     Boolean,
     Float,
     DateTime,
     Integer,
+    Index,
     UniqueConstraint,
+    create_engine,
+    event,
+    func,
+    insert,
+    select,
     text,
 )
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
 DB_URL = os.getenv("DB_URL", "sqlite+aiosqlite:///company_kpi.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Har bir yangi ulanishga qo'llanadigan SQLite sozlamalari (bo'sh qiymat - o'tkazib yuboriladi)
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT", "5000"),  # ms
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),  # manfiy - KiB (64 MB)
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", "268435456"),  # bayt (256 MB)
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+
+def apply_sqlite_pragmas(dbapi_conn, pragmas: dict):
+    cursor = dbapi_conn.cursor()
+    try:
+        for name, value in pragmas.items():
+            if value:
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def engine_options(url: str) -> dict:
+    db_url = make_url(url)
+    if db_url.get_backend_name() == "sqlite" and db_url.database in (None, "", ":memory:"):
+        # Xotiradagi baza uchun pool sozlamalari qo'llanmaydi
+        return {}
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
+
+def create_engine_with_profile(url: str, pragmas: Optional[dict] = None):
+    db_engine = create_async_engine(url, echo=False, **engine_options(url))
+
+    if make_url(url).get_backend_name() == "sqlite":
+        profile = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+        @event.listens_for(db_engine.sync_engine, "connect")
+        def _on_connect(dbapi_conn, connection_record):
+            apply_sqlite_pragmas(dbapi_conn, profile)
+
+    return db_engine
+
+
+engine = create_engine_with_profile(DB_URL)
+
+_sync_engine = None
+
+
+def get_sync_engine():
+    # Event loop'dan tashqarida (thread/process) ishlaydigan hisobotlar uchun sinxron engine
+    global _sync_engine
+    if _sync_engine is None:
+        url = make_url(DB_URL)
+        url = url.set(drivername=url.get_backend_name())
+        _sync_engine = create_engine(url, echo=False)
+
+        if url.get_backend_name() == "sqlite":
+            @event.listens_for(_sync_engine, "connect")
+            def _on_connect(dbapi_conn, connection_record):
+                apply_sqlite_pragmas(dbapi_conn, SQLITE_PRAGMAS)
+
+    return _sync_engine
+
 
-engine = create_async_engine(DB_URL, echo=False)
 async_session = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -26,12 +105,20 @@ async_session = async_sessionmaker(
 )
 
 
+def current_period() -> str:
+    # Ledger yozuvlari va SalaryHistory.month uchun umumiy kalit: 2026-03
+    return datetime.now().strftime("%Y-%m")
+
+
 class Base(DeclarativeBase):
     pass
 
 
 class Employee(Base):
     __tablename__ = "employees"
+    __table_args__ = (
+        Index("ix_employees_status_full_name", "status", "full_name"),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)  # Telegram ID
     full_name: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -71,6 +158,11 @@ class Employee(Base):
 
 class KPI(Base):
     __tablename__ = "kpi"
+    __table_args__ = (
+        Index("ix_kpi_employee_closed", "employee_id", "is_closed"),
+        Index("ix_kpi_employee_period", "employee_id", "period"),
+        Index("ix_kpi_open", "employee_id", sqlite_where=text("is_closed = 0")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     employee_id: Mapped[int] = mapped_column(
@@ -80,6 +172,7 @@ class KPI(Base):
     amount: Mapped[float] = mapped_column(Float, default=0, nullable=False)
     description: Mapped[str] = mapped_column(String(255), nullable=False)
 
+    period: Mapped[str] = mapped_column(String(7), default=current_period, nullable=False)  # 2026-03
     is_closed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
@@ -88,6 +181,11 @@ class KPI(Base):
 
 class Advance(Base):
     __tablename__ = "advances"
+    __table_args__ = (
+        Index("ix_advances_employee_closed", "employee_id", "is_closed"),
+        Index("ix_advances_employee_period", "employee_id", "period"),
+        Index("ix_advances_open", "employee_id", sqlite_where=text("is_closed = 0")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     employee_id: Mapped[int] = mapped_column(
@@ -97,6 +195,7 @@ class Advance(Base):
     amount: Mapped[float] = mapped_column(Float, default=0, nullable=False)
     description: Mapped[str] = mapped_column(String(255), nullable=False)
 
+    period: Mapped[str] = mapped_column(String(7), default=current_period, nullable=False)  # 2026-03
     is_closed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
@@ -105,6 +204,11 @@ class Advance(Base):
 
 class Penalty(Base):
     __tablename__ = "penalties"
+    __table_args__ = (
+        Index("ix_penalties_employee_closed", "employee_id", "is_closed"),
+        Index("ix_penalties_employee_period", "employee_id", "period"),
+        Index("ix_penalties_open", "employee_id", sqlite_where=text("is_closed = 0")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     employee_id: Mapped[int] = mapped_column(
@@ -114,6 +218,7 @@ class Penalty(Base):
     amount: Mapped[float] = mapped_column(Float, default=0, nullable=False)
     reason: Mapped[str] = mapped_column(String(255), nullable=False)
 
+    period: Mapped[str] = mapped_column(String(7), default=current_period, nullable=False)  # 2026-03
     is_closed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
@@ -124,6 +229,7 @@ class SalaryHistory(Base):
     __tablename__ = "salary_history"
     __table_args__ = (
         UniqueConstraint("employee_id", "month", name="uq_salaryhistory_employee_month"),
+        Index("ix_salary_history_month_paid", "month", "is_paid"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -150,132 +256,254 @@ class SalaryHistory(Base):
     employee: Mapped["Employee"] = relationship("Employee", back_populates="salary_history")
 
 
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-
-async def migrate_db():
-    async with engine.begin() as conn:
-        # =========================
-        # employees jadvali
-        # =========================
-        result = await conn.execute(text("PRAGMA table_info(employees)"))
-        employee_columns = [row[1] for row in result.fetchall()]
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
 
-        if "status" not in employee_columns:
-            await conn.execute(
-                text("ALTER TABLE employees ADD COLUMN status VARCHAR(20) DEFAULT 'pending'")
-            )
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
-        if "salary_type" not in employee_columns:
-            await conn.execute(
-                text("ALTER TABLE employees ADD COLUMN salary_type VARCHAR(20)")
-            )
 
-        if "base_salary" not in employee_columns:
-            await conn.execute(
-                text("ALTER TABLE employees ADD COLUMN base_salary FLOAT DEFAULT 0")
-            )
-
-        if "role" not in employee_columns:
-            await conn.execute(
-                text("ALTER TABLE employees ADD COLUMN role VARCHAR(50) DEFAULT 'worker'")
-            )
+class EmployeeBalance(Base):
+    __tablename__ = "employee_balances"
 
-        if "created_at" not in employee_columns:
-            await conn.execute(
-                text("ALTER TABLE employees ADD COLUMN created_at DATETIME")
-            )
-
-        await conn.execute(text("UPDATE employees SET status='pending' WHERE status IS NULL"))
-        await conn.execute(text("UPDATE employees SET base_salary=0 WHERE base_salary IS NULL"))
-        await conn.execute(text("UPDATE employees SET role='worker' WHERE role IS NULL"))
-
-        # =========================
-        # kpi jadvali
-        # =========================
-        result = await conn.execute(text("PRAGMA table_info(kpi)"))
-        kpi_columns = [row[1] for row in result.fetchall()]
-
-        if "is_closed" not in kpi_columns:
-            await conn.execute(
-                text("ALTER TABLE kpi ADD COLUMN is_closed BOOLEAN DEFAULT 0")
-            )
-
-        if "created_at" not in kpi_columns:
-            await conn.execute(
-                text("ALTER TABLE kpi ADD COLUMN created_at DATETIME")
-            )
+    # Ochiq (yopilmagan) davr bo'yicha jamlangan summalar
+    employee_id: Mapped[int] = mapped_column(
+        ForeignKey("employees.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    total_kpi: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    total_advance: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    total_penalty: Mapped[float] = mapped_column(Float, default=0, nullable=False)
 
-        await conn.execute(text("UPDATE kpi SET is_closed=0 WHERE is_closed IS NULL"))
+    version: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
-        # =========================
-        # advances jadvali
-        # =========================
-        result = await conn.execute(text("PRAGMA table_info(advances)"))
-        advance_columns = [row[1] for row in result.fetchall()]
 
-        if "is_closed" not in advance_columns:
-            await conn.execute(
-                text("ALTER TABLE advances ADD COLUMN is_closed BOOLEAN DEFAULT 0")
-            )
+class Notification(Base):
+    __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_status_next_attempt", "status", "next_attempt_at"),
+    )
 
-        if "created_at" not in advance_columns:
-            await conn.execute(
-                text("ALTER TABLE advances ADD COLUMN created_at DATETIME")
-            )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    parse_mode: Mapped[Optional[str]] = mapped_column(String(20), default="HTML", nullable=True)
 
-        await conn.execute(text("UPDATE advances SET is_closed=0 WHERE is_closed IS NULL"))
+    # pending / sent / failed
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
 
-        # =========================
-        # penalties jadvali
-        # =========================
-        result = await conn.execute(text("PRAGMA table_info(penalties)"))
-        penalty_columns = [row[1] for row in result.fetchall()]
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
-        if "is_closed" not in penalty_columns:
-            await conn.execute(
-                text("ALTER TABLE penalties ADD COLUMN is_closed BOOLEAN DEFAULT 0")
-            )
 
-        if "created_at" not in penalty_columns:
-            await conn.execute(
-                text("ALTER TABLE penalties ADD COLUMN created_at DATETIME")
-            )
+class FSMRecord(Base):
+    __tablename__ = "fsm_states"
+    __table_args__ = (
+        Index("ix_fsm_states_updated_at", "updated_at"),
+    )
 
-        await conn.execute(text("UPDATE penalties SET is_closed=0 WHERE is_closed IS NULL"))
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # bot:chat:user:destiny
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, default="{}", nullable=False)  # JSON
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# =========================
+# MIGRATSIYALAR
+# =========================
+# Qadamlar yozilgan paytdagi holicha muzlatilgan: modellar (Base.metadata) yoki balance.py'ga tayanmaydi,
+# aks holda keyingi o'zgarishlar eski qadamlarni ham o'zgartirib yuboradi
+async def _existing_columns(conn, table: str) -> set:
+    result = await conn.execute(text(f"PRAGMA table_info({table})"))
+    return {row[1] for row in result.fetchall()}
+
+
+async def _add_missing_columns(conn, table: str, columns: dict):
+    existing = await _existing_columns(conn, table)
+
+    for name, ddl in columns.items():
+        if name not in existing:
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+async def _migrate_employees(conn):
+    await _add_missing_columns(conn, "employees", {
+        "status": "VARCHAR(20) DEFAULT 'pending'",
+        "salary_type": "VARCHAR(20)",
+        "base_salary": "FLOAT DEFAULT 0",
+        "role": "VARCHAR(50) DEFAULT 'worker'",
+        "created_at": "DATETIME",
+    })
+
+    await conn.execute(text("UPDATE employees SET status='pending' WHERE status IS NULL"))
+    await conn.execute(text("UPDATE employees SET base_salary=0 WHERE base_salary IS NULL"))
+    await conn.execute(text("UPDATE employees SET role='worker' WHERE role IS NULL"))
+
+
+async def _migrate_ledger(conn):
+    for table in ("kpi", "advances", "penalties"):
+        await _add_missing_columns(conn, table, {
+            "is_closed": "BOOLEAN DEFAULT 0",
+            "created_at": "DATETIME",
+        })
+
+        await conn.execute(text(f"UPDATE {table} SET is_closed=0 WHERE is_closed IS NULL"))
+
+
+async def _migrate_salary_history(conn):
+    await _add_missing_columns(conn, "salary_history", {
+        "is_paid": "BOOLEAN DEFAULT 0",
+        "paid_at": "DATETIME",
+        "is_closed": "BOOLEAN DEFAULT 0",
+        "closed_at": "DATETIME",
+        "created_at": "DATETIME",
+    })
+
+    await conn.execute(text("UPDATE salary_history SET is_paid=0 WHERE is_paid IS NULL"))
+    await conn.execute(text("UPDATE salary_history SET is_closed=0 WHERE is_closed IS NULL"))
+
+
+async def _execute_all(conn, statements):
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def _create_indexes(conn):
+    await _execute_all(conn, [
+        "CREATE INDEX IF NOT EXISTS ix_employees_status_full_name ON employees (status, full_name)",
+        "CREATE INDEX IF NOT EXISTS ix_kpi_employee_closed ON kpi (employee_id, is_closed)",
+        "CREATE INDEX IF NOT EXISTS ix_advances_employee_closed ON advances (employee_id, is_closed)",
+        "CREATE INDEX IF NOT EXISTS ix_penalties_employee_closed ON penalties (employee_id, is_closed)",
+        "CREATE INDEX IF NOT EXISTS ix_salary_history_month_paid ON salary_history (month, is_paid)",
+        "CREATE INDEX IF NOT EXISTS ix_salary_history_employee_closed_created "
+        "ON salary_history (employee_id, is_closed, created_at)",
+    ])
+
+
+async def _fill_employee_balances(conn):
+    # Ochiq (is_closed = 0) yozuvlar yig'indisi; balance.py'dagi joriy so'rovlar keyingi qadamlarda
+    # qo'shiladigan ustunlarga (masalan, 7-qadamdagi period) tayanadi
+    max_version = await conn.scalar(text("SELECT MAX(version) FROM employee_balances")) or 0
+
+    await conn.execute(text("DELETE FROM employee_balances"))
+    await conn.execute(
+        text(
+            "INSERT INTO employee_balances "
+            "(employee_id, total_kpi, total_advance, total_penalty, version, updated_at) "
+            "SELECT employee_id, SUM(kpi), SUM(advance), SUM(penalty), :version, :updated_at FROM ("
+            "  SELECT employee_id, amount AS kpi, 0.0 AS advance, 0.0 AS penalty FROM kpi WHERE is_closed = 0"
+            "  UNION ALL SELECT employee_id, 0.0, amount, 0.0 FROM advances WHERE is_closed = 0"
+            "  UNION ALL SELECT employee_id, 0.0, 0.0, amount FROM penalties WHERE is_closed = 0"
+            ") GROUP BY employee_id"
+        ),
+        {"version": max_version + 1, "updated_at": datetime.utcnow()}
+    )
 
-        # =========================
-        # salary_history jadvali
-        # =========================
-        result = await conn.execute(text("PRAGMA table_info(salary_history)"))
-        salary_columns = [row[1] for row in result.fetchall()]
 
-        if "is_paid" not in salary_columns:
+async def _create_notifications(conn):
+    await _execute_all(conn, [
+        "CREATE TABLE IF NOT EXISTS notifications ("
+        "id INTEGER NOT NULL, "
+        "chat_id BIGINT NOT NULL, "
+        "text TEXT NOT NULL, "
+        "parse_mode VARCHAR(20), "
+        "status VARCHAR(20) NOT NULL, "
+        "attempts INTEGER NOT NULL, "
+        "next_attempt_at DATETIME NOT NULL, "
+        "last_error VARCHAR(255), "
+        "created_at DATETIME NOT NULL, "
+        "sent_at DATETIME, "
+        "PRIMARY KEY (id))",
+        "CREATE INDEX IF NOT EXISTS ix_notifications_status_next_attempt ON notifications (status, next_attempt_at)",
+    ])
+
+
+async def _add_ledger_periods(conn):
+    for table in ("kpi", "advances", "penalties"):
+        await _add_missing_columns(conn, table, {"period": "VARCHAR(7)"})
+
+        # created_at UTC'da saqlanadi, period esa mahalliy oy bo'yicha (SalaryHistory.month kabi)
+        await conn.execute(text(
+            f"UPDATE {table} SET period = strftime('%Y-%m', COALESCE(created_at, CURRENT_TIMESTAMP), 'localtime') "
+            f"WHERE period IS NULL"
+        ))
+        await conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_employee_period ON {table} (employee_id, period)"
+        ))
+
+
+async def _create_fsm_states(conn):
+    await _execute_all(conn, [
+        "CREATE TABLE IF NOT EXISTS fsm_states ("
+        "\"key\" VARCHAR(255) NOT NULL, "
+        "state VARCHAR(255), "
+        "data TEXT NOT NULL, "
+        "updated_at DATETIME NOT NULL, "
+        "PRIMARY KEY (\"key\"))",
+        "CREATE INDEX IF NOT EXISTS ix_fsm_states_updated_at ON fsm_states (updated_at)",
+    ])
+
+
+async def _create_open_ledger_indexes(conn):
+    # Faqat ochiq yozuvlar indekslanadi: oyni yopish va ochiq summalar butun ledgerni emas, shu qatorlarni o'qiydi
+    await _execute_all(conn, [
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_open ON {table} (employee_id) WHERE is_closed = 0"
+        for table in ("kpi", "advances", "penalties")
+    ])
+
+
+async def _drop_salary_history_created_index(conn):
+    # Tarix (employee_id, month) unikal indeksi bo'yicha sahifalanadi - bu indeks faqat INSERT'ni sekinlashtirardi
+    await conn.execute(text("DROP INDEX IF EXISTS ix_salary_history_employee_closed_created"))
+
+
+# Tartib muhim: yangi qadam faqat ro'yxat oxiriga qo'shiladi
+MIGRATIONS = [
+    _migrate_employees,
+    _migrate_ledger,
+    _migrate_salary_history,
+    _create_indexes,
+    _fill_employee_balances,
+    _create_notifications,
+    _add_ledger_periods,
+    _create_fsm_states,
+    _create_open_ledger_indexes,
+    _drop_salary_history_created_index,
+]
+
+
+async def get_schema_version(conn) -> int:
+    try:
+        return await conn.scalar(select(func.max(SchemaVersion.version))) or 0
+    except OperationalError:
+        # schema_version jadvali hali yo'q
+        return 0
+
+
+async def _apply_migrations(current: int):
+    for version, step in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+
+        async with engine.begin() as conn:
+            await step(conn)
             await conn.execute(
-                text("ALTER TABLE salary_history ADD COLUMN is_paid BOOLEAN DEFAULT 0")
+                insert(SchemaVersion).values(version=version, applied_at=datetime.utcnow())
             )
 
-        if "paid_at" not in salary_columns:
-            await conn.execute(
-                text("ALTER TABLE salary_history ADD COLUMN paid_at DATETIME")
-            )
 
-        if "is_closed" not in salary_columns:
-            await conn.execute(
-                text("ALTER TABLE salary_history ADD COLUMN is_closed BOOLEAN DEFAULT 0")
-            )
+async def init_db():
+    async with engine.connect() as conn:
+        current = await get_schema_version(conn)
 
-        if "closed_at" not in salary_columns:
-            await conn.execute(
-                text("ALTER TABLE salary_history ADD COLUMN closed_at DATETIME")
-            )
+    if current >= len(MIGRATIONS):
+        return
 
-        if "created_at" not in salary_columns:
-            await conn.execute(
-                text("ALTER TABLE salary_history ADD COLUMN created_at DATETIME")
-            )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
-        await conn.execute(text("UPDATE salary_history SET is_paid=0 WHERE is_paid IS NULL"))
-        await conn.execute(text("UPDATE salary_history SET is_closed=0 WHERE is_closed IS NULL"))
+    await _apply_migrations(current)
@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message, Update, User
+
+FAKE_TOKEN = "123456:fake-telegram"
+FAKE_BOT_ID = 123456
+
+
+# =========================
+# SOXTA TELEGRAM SESSIYASI
+# =========================
+class FakeTelegramSession(BaseSession):
+    # Bot API'ga tarmoq so'rovi yubormaydi: chaqiruvlarni yozib oladi va soxta javob qaytaradi
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = []
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout: Optional[int] = None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls.append(method)
+        result = self._fake_result(method)
+        # Haqiqiy sessiya kabi: qaytgan obyektlar botga bog'lanadi (message.delete() va h.k. ishlaydi)
+        return result.as_(bot) if hasattr(result, "as_") else result
+
+    def _fake_result(self, method):
+        returning = method.__returning__
+        if returning is bool:
+            return True
+        if returning is User:
+            return User(id=FAKE_BOT_ID, is_bot=True, first_name="Fake bot", username="fake_bot")
+
+        # Message yoki Message | bool qaytaradigan metodlar (sendMessage, editMessageText, sendDocument...)
+        chat_id = getattr(method, "chat_id", None) or 0
+        return Message(
+            message_id=getattr(method, "message_id", None) or next(self._message_ids),
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            from_user=User(id=FAKE_BOT_ID, is_bot=True, first_name="Fake bot"),
+            text=getattr(method, "text", None),
+        )
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        if False:
+            yield b""
+
+    async def close(self):
+        pass
+
+    def counts(self) -> dict:
+        return dict(Counter(type(method).__name__ for method in self.calls))
+
+
+# =========================
+# UPDATE YASOVCHILAR
+# =========================
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> User:
+    return User(id=user_id, is_bot=False, first_name=f"User {user_id}")
+
+
+def make_message_update(user_id: int, text: str, message_id: Optional[int] = None) -> Update:
+    return Update(
+        update_id=next(_update_ids),
+        message=Message(
+            message_id=message_id or next(_update_ids),
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=_user(user_id),
+            text=text,
+        ),
+    )
+
+
+def make_callback_update(user_id: int, data: str, message_id: int = 1) -> Update:
+    return Update.model_validate({
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": FAKE_BOT_ID, "is_bot": True, "first_name": "Fake bot"},
+                "text": "...",
+            },
+        },
+    })
+
+
+def update_payload(update: Update) -> str:
+    return update.model_dump_json(exclude_none=True, by_alias=True)
+
+
+# =========================
+# WEBHOOK YUKLAMA TESTI
+# =========================
+async def webhook_load(args) -> dict:
+    # Modullar DB_URL'ni import paytida o'qiydi, shuning uchun import shu yerda
+    import aiohttp
+
+    from database import init_db
+    from bot import create_bot, build_dispatcher
+    from admin import ADMIN_ID
+    from webhook import WebhookServer, SECRET_HEADER
+
+    await init_db()
+
+    session = FakeTelegramSession(latency=args.api_latency)
+    bot = create_bot(FAKE_TOKEN, session=session)
+    dp = build_dispatcher()
+
+    secret = "load-test-secret"
+    server = WebhookServer(
+        bot,
+        dp,
+        secret=secret,
+        host="127.0.0.1",
+        port=0,
+        max_in_flight=args.max_in_flight,
+    )
+    await server.start()
+    url = f"http://127.0.0.1:{server.port}{server.path}"
+
+    # Ishchilar /start bosadi, admin menyu va so'rovlar ro'yxatini ochadi
+    updates = []
+    for i in range(args.updates):
+        if i % 10 == 0:
+            updates.append(make_message_update(ADMIN_ID, "/admin"))
+        else:
+            updates.append(make_message_update(2_000_000 + i % args.users, "/start"))
+    payloads = [update_payload(update) for update in updates]
+
+    statuses = Counter()
+    latencies = []
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async with aiohttp.ClientSession() as client:
+        async with client.post(url, data="{}", headers={SECRET_HEADER: "wrong"}) as response:
+            wrong_secret_status = response.status
+
+        async def sender():
+            while not queue.empty():
+                payload = queue.get_nowait()
+                while True:
+                    started = time.perf_counter()
+                    async with client.post(
+                        url,
+                        data=payload,
+                        headers={SECRET_HEADER: secret, "Content-Type": "application/json"}
+                    ) as response:
+                        latencies.append(time.perf_counter() - started)
+                        statuses[response.status] += 1
+                    # Telegram kabi: 2xx bo'lmasa keyinroq qayta yuboramiz
+                    if response.status == 200:
+                        break
+                    await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+        accepted_s = time.perf_counter() - started
+
+        await server.stop()
+        total_s = time.perf_counter() - started
+
+    await bot.session.close()
+
+    latencies.sort()
+    return {
+        "benchmark": "webhook",
+        "updates": args.updates,
+        "concurrency": args.concurrency,
+        "max_in_flight": args.max_in_flight,
+        "api_latency_s": args.api_latency,
+        "wrong_secret_status": wrong_secret_status,
+        "http_statuses": dict(statuses),
+        "accept_s": round(accepted_s, 3),
+        "total_with_drain_s": round(total_s, 3),
+        "updates_per_s": round(args.updates / total_s, 1),
+        "post_p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "post_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        "server": server.stats(),
+        "bot_api_calls": session.counts(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Soxta Telegram bilan webhook yuklama testi (tarmoqsiz)")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=40, help="Parallel HTTP ulanishlar (Telegram max_connections)")
+    parser.add_argument("--max-in-flight", type=int, default=100)
+    parser.add_argument("--api-latency", type=float, default=0.02, help="Bot API javobi kechikishi, soniya")
+    parser.add_argument("--output", help="Natijani JSON faylga yozish")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DB_URL", f"sqlite+aiosqlite:///{os.path.join(tmp, 'webhook.db')}")
+        results = asyncio.run(webhook_load(args))
+
+    payload = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    print(payload)
+
+    failed = results["server"]["failed"] or results["wrong_secret_status"] != 401
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from metrics import job_latency
+
+logger = logging.getLogger(__name__)
+
+REPORT_EXECUTOR = os.getenv("REPORT_EXECUTOR", "process")  # process / thread
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_QUEUE_LIMIT = int(os.getenv("REPORT_QUEUE_LIMIT", "20"))
+
+
+class ReportQueueFull(Exception):
+    pass
+
+
+# =========================
+# HISOBOTLAR NAVBATI
+# =========================
+class ReportJobQueue:
+    def __init__(self, workers: int = REPORT_WORKERS, limit: int = REPORT_QUEUE_LIMIT, kind: str = REPORT_EXECUTOR):
+        self.workers = workers
+        self.limit = limit
+        self.kind = kind
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(workers)
+        self._ids = itertools.count(1)
+        self._tasks = {}
+        self._started = set()
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report")
+            else:
+                # fork emas: asosiy jarayonda aiosqlite thread'lari va event loop bor
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._executor
+
+    def submit(self, func, *args, on_done=None) -> int:
+        if self.queued + self.running >= self.limit:
+            raise ReportQueueFull()
+
+        job_id = next(self._ids)
+        self.queued += 1
+        task = asyncio.create_task(self._run(job_id, func, args, on_done))
+        task.add_done_callback(partial(self._on_task_done, job_id))
+        self._tasks[job_id] = task
+        return job_id
+
+    async def _run(self, job_id: int, func, args, on_done):
+        async with self._semaphore:
+            self._started.add(job_id)
+            self.queued -= 1
+            self.running += 1
+            started = time.perf_counter()
+            try:
+                result, error = await self._execute(func, args), None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result, error = None, e
+                self.failed += 1
+                logger.exception("Hisobot #%s yaratilmadi", job_id)
+            finally:
+                self.running -= 1
+                job_latency.observe(getattr(func, "__name__", "job"), time.perf_counter() - started)
+
+        if error is None:
+            self.completed += 1
+        if on_done:
+            await on_done(job_id, result, error)
+
+    def _on_task_done(self, job_id: int, task: asyncio.Task):
+        self._tasks.pop(job_id, None)
+        if job_id not in self._started:
+            # Navbatda turgan paytida bekor qilingan
+            self.queued -= 1
+        self._started.discard(job_id)
+        if task.cancelled():
+            self.cancelled += 1
+
+    async def _execute(self, func, args):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), func, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Boshlangan ishni to'xtatib bo'lmaydi - natija tayyor bo'lganda vaqtinchalik fayl o'chiriladi
+            future.add_done_callback(_discard_result)
+            raise
+        except BrokenProcessPool:
+            # Keyingi ish yangi pool bilan boshlanadi
+            self._executor = None
+            raise
+
+    async def wait(self, job_id: int):
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    def cancel(self, job_id: int) -> bool:
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "limit": self.limit,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _discard_result(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    result = future.result()
+    if result is not None and hasattr(result, "cleanup"):
+        result.cleanup()
+
+
+report_queue = ReportJobQueue()
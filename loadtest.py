@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import event
+
+# Update oqimidagi ssenariylar va ularning ulushi
+DEFAULT_MIX = "register=1,stats=6,ledger=2,export=0.2"
+SCENARIOS = ("register", "stats", "ledger", "export")
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Ro'yxatdan o'tuvchi yangi foydalanuvchilar - qizdirish va asosiy bosqichda takrorlanmasligi uchun umumiy
+_new_users = itertools.count(5_000_000)
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"noma'lum ssenariy: {name} ({', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("kamida bitta ssenariy ulushi noldan katta bo'lishi kerak")
+    return mix
+
+
+# =========================
+# SQLITE QULF KUTISHINI BAHOLASH
+# =========================
+class StatementTimer:
+    # WAL rejimida yozish qulfi birinchi yozuvchi so'rovda olinadi va busy_timeout davomida shu so'rov
+    # ichida kutiladi. O'qish qulf kutmaydi, shuning uchun u event loop kechikishini ko'rsatadi:
+    # yozuvchi so'rovning shu darajadan ortiq vaqti - qulf kutish bahosi
+    def __init__(self):
+        self.reads = []
+        self.writes = []
+        self.busy_errors = 0
+        self._started = {}
+
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        is_write = statement.lstrip().upper().startswith(WRITE_PREFIXES)
+        self._started[id(cursor)] = (time.perf_counter(), is_write)
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+        started = self._started.pop(id(cursor), None)
+        if started is not None:
+            started_at, is_write = started
+            (self.writes if is_write else self.reads).append(time.perf_counter() - started_at)
+
+    def error(self, context):
+        self._started.pop(id(context.cursor), None)
+        if "database is locked" in str(context.original_exception):
+            self.busy_errors += 1
+
+    def reset(self):
+        self.reads.clear()
+        self.writes.clear()
+        self.busy_errors = 0
+
+    def attach(self, engine):
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self.before)
+        event.listen(sync_engine, "after_cursor_execute", self.after)
+        event.listen(sync_engine, "handle_error", self.error)
+
+    def detach(self, engine):
+        sync_engine = engine.sync_engine
+        event.remove(sync_engine, "before_cursor_execute", self.before)
+        event.remove(sync_engine, "after_cursor_execute", self.after)
+        event.remove(sync_engine, "handle_error", self.error)
+
+
+# =========================
+# SSENARIYLAR
+# =========================
+class LoadTest:
+    def __init__(self, bot, dp, employee_ids, admin_id: int, mix: dict, seed: int):
+        self.bot = bot
+        self.dp = dp
+        self.employee_ids = employee_ids
+        self.admin_id = admin_id
+        self.mix = mix
+        self.rng = random.Random(seed)
+
+        self.latencies = defaultdict(list)
+        self.unhandled = Counter()
+        self.errors = Counter()
+        self.updates = 0
+
+        # Admin bitta: uning FSM oqimlari bir-biriga aralashmasligi kerak
+        self._admin_lock = asyncio.Lock()
+
+    async def _feed(self, scenario: str, update):
+        from aiogram.dispatcher.event.bases import UNHANDLED
+
+        started = time.perf_counter()
+        try:
+            result = await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+            result = None
+        self.latencies[scenario].append(time.perf_counter() - started)
+        self.updates += 1
+        if result is UNHANDLED:
+            self.unhandled[scenario] += 1
+
+    async def register(self):
+        from fake_telegram import make_message_update
+
+        user_id = next(_new_users)
+        for text in ("/start", f"Yuklama {user_id}", f"+99899{user_id % 10_000_000:07d}"):
+            await self._feed("register", make_message_update(user_id, text))
+
+    async def stats(self):
+        from fake_telegram import make_callback_update
+
+        user_id = self.rng.choice(self.employee_ids)
+        for data in ("current_month_stats", "salary_history", "back_to_main"):
+            await self._feed("stats", make_callback_update(user_id, data))
+
+    async def ledger(self):
+        from fake_telegram import make_message_update, make_callback_update
+
+        button = self.rng.choice(["📈 Mukofot pullari (Premiya)", "💸 Avans berish", "⚠️ Jarima yozish"])
+        emp_id = self.rng.choice(self.employee_ids)
+        async with self._admin_lock:
+            await self._feed("ledger", make_message_update(self.admin_id, button))
+            await self._feed("ledger", make_callback_update(self.admin_id, f"emp_{emp_id}"))
+            await self._feed("ledger", make_message_update(self.admin_id, "100000"))
+            await self._feed("ledger", make_message_update(self.admin_id, "Yuklama testi"))
+
+    async def export(self):
+        from fake_telegram import make_message_update
+
+        async with self._admin_lock:
+            await self._feed("export", make_message_update(self.admin_id, "📥 Umumiy hisobot"))
+
+    async def client(self, iterations: int):
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        for _ in range(iterations):
+            scenario = self.rng.choices(names, weights)[0]
+            await getattr(self, scenario)()
+
+    async def run(self, concurrency: int, iterations: int) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(self.client(iterations) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+# =========================
+# ISHGA TUSHIRISH
+# =========================
+async def _wait_reports(report_queue, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = report_queue.stats()
+        if not stats["queued"] and not stats["running"]:
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def run_load(args) -> dict:
+    # Modullar DB_URL'ni import paytida o'qiydi, shuning uchun import shu yerda
+    from sqlalchemy import select
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    from benchmark import summarize, percentile
+    from database import engine, init_db, Employee
+    from bot import create_bot, build_dispatcher
+    from fake_telegram import FakeTelegramSession, FAKE_TOKEN
+    from admin import ADMIN_ID
+    from jobs import report_queue
+    from outbox import NotificationDispatcher
+    from metrics import render_metrics
+    from cache import rendered_responses
+    from throttling import user_buckets
+
+    await init_db()
+
+    session = FakeTelegramSession(latency=args.api_latency)
+    bot = create_bot(FAKE_TOKEN, session=session)
+    # bot.main bilan bir xil: admin_router + user_router, FSM SQLite'da (--memory-fsm bo'lmasa)
+    dp = build_dispatcher(storage=MemoryStorage() if args.memory_fsm else None)
+    notifier = NotificationDispatcher(bot)
+    notifier.start()
+
+    async with engine.connect() as conn:
+        employee_ids = (
+            await conn.execute(select(Employee.id).where(Employee.status == "approved"))
+        ).scalars().all()
+
+    timer = StatementTimer()
+    timer.attach(engine)
+    try:
+        # Raqobatsiz bosqich: keshlar qiziydi va yozuvchi so'rovning bazaviy vaqti o'lchanadi
+        warmup = LoadTest(bot, dp, employee_ids, ADMIN_ID, args.mix, args.seed + 1)
+        await warmup.run(1, args.warmup)
+        base_read = percentile(timer.reads, 50)
+        base_write = percentile(timer.writes, 50)
+        timer.reset()
+
+        load = LoadTest(bot, dp, employee_ids, ADMIN_ID, args.mix, args.seed)
+        wall_s = await load.run(args.concurrency, args.iterations)
+        reports_done = await _wait_reports(report_queue, args.report_timeout)
+    finally:
+        timer.detach(engine)
+        await notifier.stop()
+        await report_queue.shutdown()
+        await dp.fsm.storage.close()
+        await bot.session.close()
+
+    all_latencies = [value for values in load.latencies.values() for value in values]
+    # Raqobatsiz yozish vaqti + yuklama ostidagi event loop kechikishi (o'qishlar bo'yicha)
+    loop_delay = max(0.0, percentile(timer.reads, 50) - base_read)
+    expected_write = base_write + loop_delay
+    excess = [max(0.0, duration - expected_write) for duration in timer.writes]
+
+    results = {
+        "benchmark": "loadtest",
+        "params": {
+            "employees": len(employee_ids),
+            "concurrency": args.concurrency,
+            "iterations": args.iterations,
+            "mix": args.mix,
+            "api_latency_s": args.api_latency,
+            "fsm": "memory" if args.memory_fsm else "sqlite",
+            "seed": args.seed,
+        },
+        "wall_s": round(wall_s, 3),
+        "updates": load.updates,
+        "updates_per_s": round(load.updates / wall_s, 1) if wall_s else 0.0,
+        "latency": summarize(all_latencies),
+        "by_scenario": {name: summarize(values) for name, values in sorted(load.latencies.items())},
+        "unhandled": dict(load.unhandled),
+        "errors": dict(load.errors),
+        "db_lock_wait": {
+            "write_statements": len(timer.writes),
+            "uncontended_write_p50_ms": round(base_write * 1000, 3),
+            "loop_delay_p50_ms": round(loop_delay * 1000, 3),
+            "read_p50_ms": round(percentile(timer.reads, 50) * 1000, 3),
+            "write_p50_ms": round(percentile(timer.writes, 50) * 1000, 3),
+            "write_p99_ms": round(percentile(timer.writes, 99) * 1000, 3),
+            "estimated_wait_s": round(sum(excess), 4),
+            "estimated_wait_share": round(sum(excess) / wall_s, 4) if wall_s else 0.0,
+            "busy_errors": timer.busy_errors,
+        },
+        "reports": dict(report_queue.stats(), all_finished=reports_done),
+        "outbox": notifier.stats(),
+        "throttle": user_buckets.stats(),
+        "response_cache": rendered_responses.stats(),
+        "fsm": dp.fsm.storage.stats() if hasattr(dp.fsm.storage, "stats") else {},
+        "bot_api_calls": session.counts(),
+    }
+    if args.metrics:
+        results["prometheus"] = render_metrics()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Haqiqiy Dispatcher'ga sintetik update oqimini berib yuklama testi (tarmoqsiz)"
+    )
+    parser.add_argument("--employees", type=int, default=500, help="Sintetik bazadagi tasdiqlangan ishchilar")
+    parser.add_argument("--entries", type=int, default=3)
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--db", help="Tayyor bazaga qarshi ishlatish (nusxasi olinmaydi - bazaga yozadi!)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Parallel virtual foydalanuvchilar")
+    parser.add_argument("--iterations", type=int, default=50, help="Har bir virtual foydalanuvchi ssenariylari soni")
+    parser.add_argument("--warmup", type=int, default=20, help="Raqobatsiz qizdirish ssenariylari")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Ssenariy ulushlari, masalan {DEFAULT_MIX}")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Soxta Bot API javobi kechikishi, soniya")
+    parser.add_argument("--memory-fsm", action="store_true", help="FSM'ni SQLite o'rniga xotirada saqlash")
+    parser.add_argument("--report-timeout", type=float, default=120.0, help="Navbatdagi hisobotlarni kutish, soniya")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--metrics", action="store_true", help="Natijaga Prometheus matnini qo'shish")
+    parser.add_argument("--output", help="Natijani JSON faylga yozish")
+    args = parser.parse_args()
+
+    os.environ.setdefault("METRICS_PORT", "0")
+    # Har bir update uchun INFO log o'lchovni buzadi
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.abspath(args.db) if args.db else os.path.join(tmp, "loadtest.db")
+        os.environ["DB_URL"] = f"sqlite+aiosqlite:///{path}"
+
+        if not args.db:
+            from benchmark import seed_database
+            seed_database(path, args.employees, entries=args.entries, months=args.months, seed=args.seed)
+
+        results = asyncio.run(run_load(args))
+
+    from benchmark import emit
+    emit(results, args.output)
+
+    failed = results["errors"] or results["unhandled"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import bisect
+import contextvars
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 - o'chirilgan
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+# =========================
+# METRIKA TURLARI
+# =========================
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets, label: str = "handler"):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series = {}
+
+    def observe(self, label_value: str, value: float):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+        counts, _, _ = series
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(counts):
+            counts[index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total, count) in sorted(self._series.items()):
+            labels = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class LabeledValue:
+    def __init__(self, name: str, help_text: str, kind: str):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind  # counter / gauge
+        self._values = defaultdict(float)
+
+    def inc(self, handler: str, amount: float = 1):
+        self._values[handler] += amount
+
+    def dec(self, handler: str, amount: float = 1):
+        self._values[handler] -= amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for handler, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{{handler="{handler}"}} {value:g}')
+        return lines
+
+
+handler_latency = Histogram(
+    "bot_handler_duration_seconds", "Update qayta ishlash vaqti (filtrlar + handler)", LATENCY_BUCKETS
+)
+handler_statements = Histogram(
+    "bot_handler_sql_statements", "Bitta update uchun bajarilgan SQL so'rovlar soni", STATEMENT_BUCKETS
+)
+job_latency = Histogram(
+    "bot_job_duration_seconds", "Fon ishlari (Excel hisobot) bajarilish vaqti", LATENCY_BUCKETS + (30.0, 60.0), label="job"
+)
+handler_errors = LabeledValue("bot_handler_errors_total", "Handlerda ko'tarilgan xatolar", "counter")
+handler_in_flight = LabeledValue("bot_handler_in_flight", "Hozir bajarilayotgan handlerlar", "gauge")
+
+_sql_statements_total = 0
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+class _UpdateMetrics:
+    __slots__ = ("handler", "statements")
+
+    def __init__(self):
+        self.handler: Optional[str] = None
+        self.statements = 0
+
+
+_current: contextvars.ContextVar[Optional[_UpdateMetrics]] = contextvars.ContextVar("update_metrics", default=None)
+
+
+# =========================
+# MIDDLEWARE'LAR
+# =========================
+class MetricsOuterMiddleware(BaseMiddleware):
+    # Router darajasida: filtrlar bilan birga to'liq vaqt, handler nomini ichki middleware aniqlaydi
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        metrics = _UpdateMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(metrics.handler or "unknown")
+            raise
+        finally:
+            _current.reset(token)
+            # Routerga tegishli bo'lmagan update'lar (filtrdan o'tmagan) hisobga olinmaydi
+            if metrics.handler is not None:
+                handler_latency.observe(metrics.handler, time.perf_counter() - started)
+                handler_statements.observe(metrics.handler, metrics.statements)
+
+
+class MetricsInnerMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.handler = name
+
+        handler_in_flight.inc(name)
+        try:
+            return await handler(event, data)
+        finally:
+            handler_in_flight.dec(name)
+
+
+def install_metrics(*routers):
+    for router in routers:
+        for observer in (router.message, router.callback_query):
+            observer.outer_middleware(MetricsOuterMiddleware())
+            observer.middleware(MetricsInnerMiddleware())
+
+
+def _count_statement(*args):
+    global _sql_statements_total
+    _sql_statements_total += 1
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.statements += 1
+
+
+def instrument_engine(engine):
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _count_statement):
+        event.listen(engine.sync_engine, "before_cursor_execute", _count_statement)
+
+
+def register_collector(name: str, collect: Callable[[], dict]):
+    # collect() - {"kalit": son} qaytaradi, har biri payroll_<name>_<kalit> gauge bo'ladi
+    _collectors[name] = collect
+
+
+# =========================
+# PROMETHEUS ENDPOINT
+# =========================
+def render_metrics() -> str:
+    lines = []
+    for metric in (handler_latency, handler_statements, job_latency, handler_errors, handler_in_flight):
+        lines.extend(metric.render())
+
+    lines.append("# HELP bot_sql_statements_total Jami bajarilgan SQL so'rovlar")
+    lines.append("# TYPE bot_sql_statements_total counter")
+    lines.append(f"bot_sql_statements_total {_sql_statements_total}")
+
+    for name, collect in sorted(_collectors.items()):
+        try:
+            values = collect()
+        except Exception:
+            logger.exception("Metrika yig'uvchi %s ishlamadi", name)
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE payroll_{name}_{key} gauge")
+                lines.append(f"payroll_{name}_{key} {value:g}")
+
+    return "\n".join(lines) + "\n"
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    if not port:
+        return None
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("📊 Metrikalar http://%s:%s/metrics manzilida", host, port)
+    return runner
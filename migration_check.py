@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+# Migratsiyalar boshlanishidan oldingi sxema (baseline), o'sha paytdagi holicha muzlatilgan
+BASELINE_SCHEMA = """
+CREATE TABLE employees (
+    id BIGINT NOT NULL,
+    full_name VARCHAR(100) NOT NULL,
+    phone VARCHAR(20) NOT NULL,
+    role VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    salary_type VARCHAR(20),
+    base_salary FLOAT NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE TABLE kpi (
+    id INTEGER NOT NULL,
+    employee_id BIGINT NOT NULL,
+    amount FLOAT NOT NULL,
+    description VARCHAR(255) NOT NULL,
+    is_closed BOOLEAN NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(employee_id) REFERENCES employees (id) ON DELETE CASCADE
+);
+CREATE TABLE advances (
+    id INTEGER NOT NULL,
+    employee_id BIGINT NOT NULL,
+    amount FLOAT NOT NULL,
+    description VARCHAR(255) NOT NULL,
+    is_closed BOOLEAN NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(employee_id) REFERENCES employees (id) ON DELETE CASCADE
+);
+CREATE TABLE penalties (
+    id INTEGER NOT NULL,
+    employee_id BIGINT NOT NULL,
+    amount FLOAT NOT NULL,
+    reason VARCHAR(255) NOT NULL,
+    is_closed BOOLEAN NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(employee_id) REFERENCES employees (id) ON DELETE CASCADE
+);
+CREATE TABLE salary_history (
+    id INTEGER NOT NULL,
+    employee_id BIGINT NOT NULL,
+    total_kpi FLOAT NOT NULL,
+    total_advance FLOAT NOT NULL,
+    total_penalty FLOAT NOT NULL,
+    final_salary FLOAT NOT NULL,
+    month VARCHAR(10) NOT NULL,
+    is_paid BOOLEAN NOT NULL,
+    paid_at DATETIME,
+    is_closed BOOLEAN NOT NULL,
+    closed_at DATETIME,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    CONSTRAINT uq_salaryhistory_employee_month UNIQUE (employee_id, month),
+    FOREIGN KEY(employee_id) REFERENCES employees (id) ON DELETE CASCADE
+);
+"""
+
+
+# =========================
+# BASELINE BAZA
+# =========================
+def create_baseline(path: str):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO employees (id, full_name, phone, role, status, salary_type, base_salary, created_at) "
+            "VALUES (?, ?, ?, 'worker', ?, 'Fix', 3000000, '2026-01-05 09:00:00')",
+            [(1, "Ishchi 1", "+998900000001", "approved"), (2, "Ishchi 2", "+998900000002", "approved"),
+             (3, "Ishchi 3", "+998900000003", "pending")]
+        )
+        # Yopilgan o'tgan oy va ochiq joriy oy yozuvlari
+        for table, text_column in (("kpi", "description"), ("advances", "description"), ("penalties", "reason")):
+            conn.executemany(
+                f"INSERT INTO {table} (employee_id, amount, {text_column}, is_closed, created_at) VALUES (?, ?, 'x', ?, ?)",
+                [(1, 100000, 1, "2026-01-10 09:00:00"), (1, 20000, 0, "2026-02-10 09:00:00"),
+                 (2, 5000, 0, "2026-02-11 09:00:00"), (2, 7000, 0, "2026-02-12 09:00:00")]
+            )
+        conn.execute(
+            "INSERT INTO salary_history (employee_id, total_kpi, total_advance, total_penalty, final_salary, month, "
+            "is_paid, paid_at, is_closed, closed_at, created_at) "
+            "VALUES (1, 100000, 100000, 100000, 2900000, '2026-01', 1, '2026-01-31', 1, '2026-01-31', '2026-01-31')"
+        )
+    conn.close()
+
+
+def _upgrade() -> dict:
+    # Alohida jarayonda: database moduli DB_URL'ni import paytida o'qiydi
+    from database import init_db, MIGRATIONS
+
+    asyncio.run(init_db())
+    # Ikkinchi ishga tushirish hech narsa qilmasligi kerak
+    asyncio.run(init_db())
+    return {"migrations": len(MIGRATIONS)}
+
+
+def upgrade(path: str) -> dict:
+    env = dict(os.environ, DB_URL=f"sqlite+aiosqlite:///{path}")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker"],
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if "Error" in line]
+        raise RuntimeError(errors[-1].strip() if errors else "init_db xatosi")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# =========================
+# SXEMANI SOLISHTIRISH
+# =========================
+def describe_schema(path: str) -> dict:
+    # Jadval -> ustunlar nomi va indekslar (ustunlar, qisman indeks sharti); ustunlar tartibi va
+    # DEFAULT'lar ALTER TABLE tufayli farq qilishi mumkin, shuning uchun solishtirilmaydi
+    conn = sqlite3.connect(path)
+    schema = {}
+    tables = [
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )
+    ]
+    for table in tables:
+        columns = sorted(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+        indexes = {}
+        for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table,)
+        ):
+            indexed = tuple(row[2] for row in conn.execute(f"PRAGMA index_info({name})"))
+            where = sql.split(" WHERE ", 1)[1].strip() if " WHERE " in sql else None
+            indexes[name] = (indexed, where)
+        schema[table] = {"columns": columns, "indexes": indexes}
+    conn.close()
+    return schema
+
+
+def model_schema(path: str) -> dict:
+    from sqlalchemy import create_engine
+    from database import Base
+
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    return describe_schema(path)
+
+
+def schema_diff(actual: dict, expected: dict) -> list:
+    diffs = []
+    for table in sorted(expected.keys() | actual.keys()):
+        if table not in actual:
+            diffs.append(f"{table}: jadval yo'q")
+        elif table not in expected:
+            diffs.append(f"{table}: modelda yo'q jadval")
+        else:
+            for part in ("columns", "indexes"):
+                if actual[table][part] != expected[table][part]:
+                    diffs.append(f"{table}.{part}: {actual[table][part]} != model {expected[table][part]}")
+    return diffs
+
+
+# =========================
+# TEKSHIRISH
+# =========================
+def check_upgraded(path: str, migrations: int) -> list:
+    failures = []
+    conn = sqlite3.connect(path)
+
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    if versions != list(range(1, migrations + 1)):
+        failures.append(f"schema_version: {versions}, kutilgan 1..{migrations}")
+
+    for table in ("kpi", "advances", "penalties"):
+        missing = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE period IS NULL").fetchone()[0]
+        if missing:
+            failures.append(f"{table}: {missing} ta yozuvda period yo'q")
+
+    expected = dict(
+        (row[0], row[1:]) for row in conn.execute(
+            "SELECT employee_id, SUM(k), SUM(a), SUM(p) FROM ("
+            "  SELECT employee_id, amount AS k, 0 AS a, 0 AS p FROM kpi WHERE is_closed = 0"
+            "  UNION ALL SELECT employee_id, 0, amount, 0 FROM advances WHERE is_closed = 0"
+            "  UNION ALL SELECT employee_id, 0, 0, amount FROM penalties WHERE is_closed = 0"
+            ") GROUP BY employee_id"
+        )
+    )
+    stored = dict(
+        (row[0], row[1:]) for row in conn.execute(
+            "SELECT employee_id, total_kpi, total_advance, total_penalty FROM employee_balances"
+        )
+    )
+    if expected != stored:
+        failures.append(f"employee_balances: {stored} != ledger {expected}")
+
+    conn.close()
+    return failures
+
+
+def check() -> list:
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        expected = model_schema(os.path.join(tmp, "models.db"))
+
+        # Eski o'rnatma (baseline) va yangi bo'sh baza bir xil sxemaga kelishi kerak
+        baseline = os.path.join(tmp, "baseline.db")
+        create_baseline(baseline)
+        fresh = os.path.join(tmp, "fresh.db")
+
+        for name, path in (("baseline", baseline), ("bo'sh baza", fresh)):
+            try:
+                result = upgrade(path)
+            except RuntimeError as e:
+                failures.append(f"{name} -> HEAD: {e}")
+                continue
+            failures += [f"{name}: {failure}" for failure in check_upgraded(path, result["migrations"])]
+            failures += [f"{name}: {diff}" for diff in schema_diff(describe_schema(path), expected)]
+
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Baseline sxemadagi bazani oxirgi migratsiyagacha yangilash tekshiruvi")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(_upgrade()))
+        return 0
+
+    failures = check()
+    if not failures:
+        print("OK: baseline va bo'sh baza oxirgi migratsiyagacha yangilandi, sxema modellarga mos.")
+        return 0
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramForbiddenError,
+    TelegramBadRequest,
+)
+from sqlalchemy import select, update, insert, delete, func
+
+from database import async_session, Notification
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))  # xabar/soniya (Telegram limiti ~30)
+OUTBOX_CHAT_INTERVAL = float(os.getenv("OUTBOX_CHAT_INTERVAL", "1.0"))  # bitta chatga xabarlar orasidagi soniya
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", "7"))  # yuborilgan xabarlar shuncha kun saqlanadi
+OUTBOX_PRUNE_INTERVAL = float(os.getenv("OUTBOX_PRUNE_INTERVAL", "3600"))  # soniya
+OUTBOX_PRUNE_BATCH = int(os.getenv("OUTBOX_PRUNE_BATCH", "1000"))
+
+_wakeup: Optional[asyncio.Event] = None
+_remote_wakeup: Optional[Callable[[], None]] = None
+
+
+# =========================
+# NAVBATGA QO'YISH
+# =========================
+def enqueue_notification(session, chat_id: int, text: str, parse_mode: Optional[str] = "HTML"):
+    # Biznes yozuvi bilan bitta tranzaksiyada saqlanadi, commit'ni chaqiruvchi qiladi
+    session.add(Notification(chat_id=chat_id, text=text, parse_mode=parse_mode))
+
+
+async def enqueue_notifications(session, messages: Iterable[tuple], parse_mode: Optional[str] = "HTML"):
+    rows = [
+        {"chat_id": chat_id, "text": text, "parse_mode": parse_mode, "next_attempt_at": datetime.utcnow()}
+        for chat_id, text in messages
+    ]
+    if rows:
+        await session.execute(insert(Notification), rows)
+    return len(rows)
+
+
+def wake_dispatcher():
+    if _wakeup is not None:
+        _wakeup.set()
+    elif _remote_wakeup is not None:
+        # Ishchi jarayonda dispetcher yo'q - supervisor'dagi dispetcher uyg'otiladi
+        _remote_wakeup()
+
+
+def set_remote_wakeup(wake: Optional[Callable[[], None]]):
+    global _remote_wakeup
+    _remote_wakeup = wake
+
+
+def sent_before_query(cutoff: datetime, limit: int = OUTBOX_PRUNE_BATCH):
+    # Yuborilgan xabar navbati oldinroq kelgan bo'ladi (next_attempt_at <= sent_at), shuning uchun
+    # next_attempt_at sharti (status, next_attempt_at) indeksi oralig'ini toraytiradi
+    return (
+        select(Notification.id)
+        .where(
+            Notification.status == "sent",
+            Notification.next_attempt_at < cutoff,
+            Notification.sent_at < cutoff
+        )
+        .limit(limit)
+    )
+
+
+def due_batch_query(now: datetime, blocked_chats: Iterable[int] = (), limit: int = OUTBOX_BATCH_SIZE):
+    # Har bir chatdan faqat eng eski xabar: bitta chatning uzun navbati boshqalarni to'sib qo'ymaydi.
+    # Qayta urinishni kutayotgan xabari bor chat butunlay o'tkaziladi - yangi xabarlar undan o'tib ketmaydi
+    waiting = select(Notification.chat_id).where(
+        Notification.status == "pending",
+        Notification.next_attempt_at > now
+    )
+    conditions = [
+        Notification.status == "pending",
+        Notification.next_attempt_at <= now,
+        Notification.chat_id.notin_(waiting),
+    ]
+    blocked_chats = list(blocked_chats)
+    if blocked_chats:
+        conditions.append(Notification.chat_id.notin_(blocked_chats))
+
+    first_ids = (
+        select(func.min(Notification.id))
+        .where(*conditions)
+        .group_by(Notification.chat_id)
+        .order_by(func.min(Notification.id))
+        .limit(limit)
+    )
+    return select(Notification).where(Notification.id.in_(first_ids)).order_by(Notification.id)
+
+
+# =========================
+# YUBORUVCHI
+# =========================
+class NotificationDispatcher:
+    def __init__(
+        self,
+        bot,
+        global_rate: float = OUTBOX_GLOBAL_RATE,
+        chat_interval: float = OUTBOX_CHAT_INTERVAL,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        retention_days: float = OUTBOX_RETENTION_DAYS,
+        prune_interval: float = OUTBOX_PRUNE_INTERVAL,
+    ):
+        self.bot = bot
+        self.send_interval = 1 / global_rate if global_rate > 0 else 0
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = timedelta(days=retention_days)
+        self.prune_interval = prune_interval
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.pruned = 0
+
+        self._task: Optional[asyncio.Task] = None
+        self._next_send_at = 0.0
+        self._chat_last_sent = {}
+        self._deferred_until: Optional[float] = None
+        self._next_prune_at = 0.0
+
+    def start(self):
+        global _wakeup
+        _wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox: xabarlarni yuborishda xatolik")
+                processed = 0
+
+            if time.monotonic() >= self._next_prune_at:
+                self._next_prune_at = time.monotonic() + self.prune_interval
+                try:
+                    await self.prune_sent()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Outbox: eski xabarlarni o'chirishda xatolik")
+
+            # Nimadir yuborilgan bo'lsa darhol davom etamiz (chatlarning keyingi xabarlari),
+            # aks holda yangi xabar yoki taymerni kutamiz
+            if processed:
+                continue
+
+            timeout = self.poll_interval
+            if self._deferred_until is not None:
+                timeout = min(timeout, max(0.0, self._deferred_until - time.monotonic()))
+
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+
+    async def process_due(self) -> int:
+        # Chat intervali tugamagan chatlar so'rovdan chiqariladi, dispetcher ular tayyor bo'lganda uyg'onadi
+        now = time.monotonic()
+        blocked = {
+            chat_id: last_sent + self.chat_interval
+            for chat_id, last_sent in self._chat_last_sent.items()
+            if last_sent + self.chat_interval > now
+        }
+        self._deferred_until = min(blocked.values()) if blocked else None
+
+        async with async_session() as session:
+            batch = (
+                await session.scalars(due_batch_query(datetime.utcnow(), blocked, self.batch_size))
+            ).all()
+
+        # Har bir chatdan bittadan xabar, shuning uchun paket ichida tartib buzilmaydi
+        for notification in batch:
+            await self._deliver(notification)
+
+        return len(batch)
+
+    async def prune_sent(self) -> int:
+        # Yozish qulfi uzoq turmasligi uchun kichik paketlarda, har biri alohida tranzaksiyada
+        old_sent = sent_before_query(datetime.utcnow() - self.retention)
+
+        deleted = 0
+        while True:
+            async with async_session() as session:
+                result = await session.execute(delete(Notification).where(Notification.id.in_(old_sent)))
+                await session.commit()
+            deleted += result.rowcount
+            if result.rowcount < OUTBOX_PRUNE_BATCH:
+                break
+
+        self.pruned += deleted
+        return deleted
+
+    async def _wait_for_global_slot(self, chat_id: int):
+        now = time.monotonic()
+        if self._next_send_at > now:
+            await asyncio.sleep(self._next_send_at - now)
+
+        now = time.monotonic()
+        self._next_send_at = now + self.send_interval
+        self._chat_last_sent[chat_id] = now
+
+        if len(self._chat_last_sent) > 10_000:
+            cutoff = now - self.chat_interval
+            self._chat_last_sent = {k: v for k, v in self._chat_last_sent.items() if v > cutoff}
+
+    async def _deliver(self, notification: Notification) -> bool:
+        await self._wait_for_global_slot(notification.chat_id)
+
+        try:
+            await self.bot.send_message(
+                chat_id=notification.chat_id,
+                text=notification.text,
+                parse_mode=notification.parse_mode
+            )
+        except TelegramRetryAfter as e:
+            # Flood limit: butun yuborish to'xtatiladi, xabar o'z navbatida qoladi
+            self._next_send_at = time.monotonic() + e.retry_after
+            self.retried += 1
+            await self._reschedule(notification, e.retry_after, str(e), count_attempt=False)
+            return False
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Bot bloklangan yoki chat topilmadi - qayta urinishdan foyda yo'q
+            self.failed += 1
+            await self._mark(notification.id, status="failed", attempts=notification.attempts + 1, last_error=str(e)[:255])
+            logger.warning("Outbox #%s yuborilmadi: %s", notification.id, e)
+            return True
+        except Exception as e:
+            attempts = notification.attempts + 1
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                await self._mark(notification.id, status="failed", attempts=attempts, last_error=str(e)[:255])
+                logger.warning("Outbox #%s %s urinishdan keyin yuborilmadi: %s", notification.id, attempts, e)
+            else:
+                self.retried += 1
+                await self._reschedule(notification, 2 ** attempts, str(e))
+            return False
+
+        self.sent += 1
+        await self._mark(notification.id, status="sent", attempts=notification.attempts + 1, sent_at=datetime.utcnow())
+        return True
+
+    async def _reschedule(self, notification: Notification, delay: float, error: str, count_attempt: bool = True):
+        await self._mark(
+            notification.id,
+            attempts=notification.attempts + (1 if count_attempt else 0),
+            next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+            last_error=error[:255]
+        )
+
+    async def _mark(self, notification_id: int, **values):
+        async with async_session() as session:
+            await session.execute(
+                update(Notification).where(Notification.id == notification_id).values(**values)
+            )
+            await session.commit()
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "pruned": self.pruned,
+        }
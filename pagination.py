@@ -0,0 +1,154 @@
+import os
+from typing import Optional
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import select, tuple_
+
+from database import Employee, SalaryHistory
+from cache import VersionedCache, get_roster_version
+
+PICKER_PAGE_SIZE = int(os.getenv("PICKER_PAGE_SIZE", "20"))
+PICKER_CACHE_SIZE = int(os.getenv("PICKER_CACHE_SIZE", "256"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "5"))
+
+# tur: (status, tugma matni, tugma callback_data)
+PICKERS = {
+    "approve": ("pending", "✅ {name}", "approve_{id}"),
+    "emp": ("approved", "{name}", "emp_{id}"),
+    "empinfo": ("approved", "👤 {name}", "empinfo_{id}"),
+}
+
+_page_cache = VersionedCache(max_size=PICKER_CACHE_SIZE)
+
+
+# =========================
+# SAHIFALASH (KEYSET)
+# =========================
+def picker_query(kind: str, direction: Optional[str], anchor_id: Optional[int], page_size: int):
+    status = PICKERS[kind][0]
+    query = select(Employee.id, Employee.full_name).where(Employee.status == status)
+
+    if anchor_id is not None:
+        # Anchor ishchining ismi shu so'rovning o'zida olinadi - (full_name, id) juftligi bo'yicha keyset
+        anchor_name = select(Employee.full_name).where(Employee.id == anchor_id).scalar_subquery()
+        anchor = tuple_(anchor_name, anchor_id)
+        key = tuple_(Employee.full_name, Employee.id)
+        query = query.where(key < anchor if direction == "p" else key > anchor)
+
+    if direction == "p":
+        query = query.order_by(Employee.full_name.desc(), Employee.id.desc())
+    else:
+        query = query.order_by(Employee.full_name, Employee.id)
+
+    # Keyingi sahifa borligini bilish uchun bitta ortiqcha qator olinadi
+    return query.limit(page_size + 1)
+
+
+async def _load_page(session, kind: str, direction: Optional[str], anchor_id: Optional[int], page_size: int):
+    rows = (await session.execute(picker_query(kind, direction, anchor_id, page_size))).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if direction == "p":
+        rows.reverse()
+        return rows, has_more, True
+
+    return rows, anchor_id is not None, has_more
+
+
+async def render_picker_page(
+    session,
+    kind: str,
+    direction: Optional[str] = None,
+    anchor_id: Optional[int] = None,
+    page_size: int = PICKER_PAGE_SIZE
+) -> Optional[InlineKeyboardMarkup]:
+    cache_key = (kind, direction, anchor_id, page_size)
+    version = get_roster_version()
+
+    cached = _page_cache.get(cache_key, version)
+    if cached is not None:
+        return cached
+
+    rows, has_prev, has_next = await _load_page(session, kind, direction, anchor_id, page_size)
+    if not rows:
+        return None
+
+    _, button_text, button_data = PICKERS[kind]
+    keyboard = [
+        [InlineKeyboardButton(
+            text=button_text.format(name=full_name),
+            callback_data=button_data.format(id=emp_id)
+        )]
+        for emp_id, full_name in rows
+    ]
+
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"pg_{kind}_p_{rows[0][0]}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"pg_{kind}_n_{rows[-1][0]}"))
+    if nav:
+        keyboard.append(nav)
+
+    markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+    _page_cache.set(cache_key, version, markup)
+    return markup
+
+
+def parse_picker_callback(data: str):
+    _, kind, direction, anchor_id = data.split("_")
+    return kind, direction, int(anchor_id)
+
+
+# =========================
+# OYLIKLAR TARIXI (KEYSET)
+# =========================
+def salary_history_query(emp_id: int, direction: Optional[str], anchor_month: Optional[str], page_size: int):
+    # (employee_id, month) unikal indeksi bo'yicha: har qanday chuqurlikdagi sahifa birinchisidek arzon.
+    # "n" - eskiroq oylar, "p" - yangiroq oylar
+    query = select(
+        SalaryHistory.month,
+        SalaryHistory.total_kpi,
+        SalaryHistory.total_advance,
+        SalaryHistory.total_penalty,
+        SalaryHistory.final_salary,
+        SalaryHistory.is_paid,
+    ).where(
+        SalaryHistory.employee_id == emp_id,
+        SalaryHistory.is_closed == True
+    )
+
+    if anchor_month is not None:
+        query = query.where(SalaryHistory.month > anchor_month if direction == "p" else SalaryHistory.month < anchor_month)
+
+    if direction == "p":
+        query = query.order_by(SalaryHistory.month)
+    else:
+        query = query.order_by(SalaryHistory.month.desc())
+
+    return query.limit(page_size + 1)
+
+
+async def load_salary_history_page(
+    session,
+    emp_id: int,
+    direction: Optional[str] = None,
+    anchor_month: Optional[str] = None,
+    page_size: int = HISTORY_PAGE_SIZE
+):
+    # (qatorlar - yangidan eskiga, yangiroq sahifa bormi, eskiroq sahifa bormi)
+    rows = (await session.execute(salary_history_query(emp_id, direction, anchor_month, page_size))).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if direction == "p":
+        rows.reverse()
+        return rows, has_more, True
+
+    return rows, anchor_month is not None, has_more
+
+
+def parse_history_callback(data: str):
+    _, direction, anchor_month = data.split("_")
+    return direction, anchor_month
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import event
+
+SIZES = (1, 500)
+
+
+# =========================
+# SO'ROVLARNI SANASH
+# =========================
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __repr__(self):
+        return f"QueryCounter(count={self.count})"
+
+
+_counter: contextvars.ContextVar[Optional[QueryCounter]] = contextvars.ContextVar("query_counter", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _counter.get()
+    if counter is not None:
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+def instrument(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def count_queries(engine=None):
+    # Faqat shu kontekstda (joriy task va undan yaratilgan tasklarda) bajarilgan so'rovlar sanaladi
+    if engine is None:
+        from database import engine
+    instrument(engine)
+
+    counter = QueryCounter()
+    token = _counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _counter.reset(token)
+
+
+def query_budget(max_queries: int):
+    # Handler uchun ruxsat etilgan eng ko'p SQL so'rovlar soni; ishlash vaqtida hech narsa qilmaydi,
+    # qiymatni `python query_budget.py` tekshiradi
+    def decorator(func):
+        func.__query_budget__ = max_queries
+        return func
+    return decorator
+
+
+# =========================
+# SSENARIYLAR
+# =========================
+def _scenarios(admin_id: int, employee_id: int, pending_id: int, month: str):
+    from fake_telegram import make_message_update, make_callback_update
+    import admin
+    import user
+
+    msg = make_message_update
+    cb = make_callback_update
+    new_user_id = 3_000_000
+
+    # Tartib muhim: FSM va vedomost holati bir qadamdan keyingisiga o'tadi
+    return [
+        ("admin_start", admin.admin_start, lambda: msg(admin_id, "/admin")),
+        ("view_requests", admin.view_requests, lambda: msg(admin_id, "📩 So'rovlar")),
+        ("approve_step1", admin.approve_step1, lambda: cb(admin_id, f"approve_{pending_id}")),
+        ("approve_step2", admin.approve_step2, lambda: cb(admin_id, "type_Fix")),
+        ("approve_step3", admin.approve_step3, lambda: msg(admin_id, "5000000")),
+        ("select_action_emp", admin.select_action_emp, lambda: msg(admin_id, "📈 Mukofot pullari (Premiya)")),
+        ("process_action_amount", admin.process_action_amount, lambda: cb(admin_id, f"emp_{employee_id}")),
+        ("process_action_desc", admin.process_action_desc, lambda: msg(admin_id, "100000")),
+        ("save_action", admin.save_action, lambda: msg(admin_id, "Reja bajarildi")),
+        ("show_employee_list", admin.show_employee_list, lambda: msg(admin_id, "📋 Ishchilar ma'lumoti")),
+        ("picker_page", admin.picker_page, lambda: cb(admin_id, f"pg_empinfo_n_{employee_id}")),
+        ("show_employee_profile", admin.show_employee_profile, lambda: cb(admin_id, f"empinfo_{employee_id}")),
+        ("show_employee_months", admin.show_employee_months, lambda: cb(admin_id, f"empmonths_{employee_id}")),
+        ("cancel_handler", admin.cancel_handler, lambda: msg(admin_id, "/cancel")),
+        ("fire_prompt", admin.fire_prompt, lambda: cb(admin_id, f"fire_{employee_id}")),
+        ("export_excel_all", admin.export_excel_all, lambda: msg(admin_id, "📥 Umumiy hisobot")),
+        ("export_excel_single", admin.export_excel_single, lambda: cb(admin_id, f"empexcel_{employee_id}")),
+        ("cancel_report", admin.cancel_report, lambda: cb(admin_id, "cancelreport_2")),
+        ("user_start_new", user.user_start, lambda: msg(new_user_id, "/start")),
+        ("process_reg_name", user.process_reg_name, lambda: msg(new_user_id, "Yangi Ishchi")),
+        ("process_reg_phone", user.process_reg_phone, lambda: msg(new_user_id, "+998901112233")),
+        ("user_start", user.user_start, lambda: msg(employee_id, "/start")),
+        ("show_current_stats", user.show_current_stats, lambda: cb(employee_id, "current_month_stats")),
+        ("show_salary_history", user.show_salary_history, lambda: cb(employee_id, "salary_history")),
+        ("salary_history_page", user.salary_history_page, lambda: cb(employee_id, f"hist_n_{month}")),
+        ("back_to_main_menu", user.back_to_main_menu, lambda: cb(employee_id, "back_to_main")),
+        ("show_unpaid_salaries", admin.show_unpaid_salaries, lambda: msg(admin_id, "💵 Oylikni to'lash")),
+        ("mark_salary_as_paid", admin.mark_salary_as_paid, lambda: cb(admin_id, "pay_salary_1")),
+        ("pay_all_prompt", admin.pay_all_prompt, lambda: cb(admin_id, f"payall_{month}")),
+        ("pay_all_cancel", admin.pay_all_cancel, lambda: cb(admin_id, "payallcancel")),
+        ("pay_all_confirm", admin.pay_all_confirm, lambda: cb(admin_id, f"payallconf_{month}")),
+        ("close_month_handler", admin.close_month_handler, lambda: msg(admin_id, "📊 Oylik yopish")),
+        ("verify_balances_handler", admin.verify_balances_handler, lambda: msg(admin_id, "/verify_balances")),
+        ("rebuild_balances_handler", admin.rebuild_balances_handler, lambda: msg(admin_id, "/rebuild_balances")),
+        ("fire_confirm", admin.fire_confirm, lambda: cb(admin_id, f"fireconf_{employee_id}")),
+    ]
+
+
+def _report_scenarios(employee_id: int):
+    # Eksport hisobot navbatida (thread/process) sinxron engine'da ishlaydi - handler kontekstida
+    # sanalmaydi, shuning uchun render_report to'g'ridan-to'g'ri o'lchanadi
+    from reports import render_report
+
+    return [
+        ("render_report_all", render_report, (None,)),
+        ("render_report_single", render_report, (employee_id,)),
+    ]
+
+
+async def _measure(employees: int) -> dict:
+    # Modullar DB_URL'ni import paytida o'qiydi - bu funksiya alohida jarayonda chaqiriladi
+    from aiogram.dispatcher.event.bases import UNHANDLED
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    from database import engine, current_period, get_sync_engine
+    from bot import create_bot, build_dispatcher
+    from fake_telegram import FakeTelegramSession, FAKE_TOKEN
+    from admin import ADMIN_ID
+    from jobs import report_queue
+
+    bot = create_bot(FAKE_TOKEN, session=FakeTelegramSession())
+    # Fon flush'i o'lchovga aralashmasligi uchun FSM xotirada
+    dp = build_dispatcher(storage=MemoryStorage())
+
+    results = {}
+    # Ssenariylar oxirida ishchi chetlatiladi, shuning uchun hisobotlar oldin o'lchanadi
+    for name, render, args in _report_scenarios(1_000_000):
+        with count_queries(get_sync_engine()) as counter:
+            report = render(*args)
+        if report:
+            report.cleanup()
+        results[name] = {
+            "queries": counter.count,
+            "budget": getattr(render, "__query_budget__", None),
+            "handled": report is not None,
+        }
+
+    for name, handler, make_update in _scenarios(ADMIN_ID, 1_000_000, 1, current_period()):
+        with count_queries(engine) as counter:
+            result = await dp.feed_update(bot, make_update())
+        results[name] = {
+            "queries": counter.count,
+            "budget": getattr(handler, "__query_budget__", None),
+            "handled": result is not UNHANDLED,
+        }
+
+    await report_queue.shutdown()
+    await bot.session.close()
+    await engine.dispose()
+    return results
+
+
+def _seed(path: str, employees: int):
+    from benchmark import seed_database
+
+    seed_database(path, employees, entries=3)
+
+    conn = sqlite3.connect(path)
+    with conn:
+        # Tasdiqlash oqimi uchun bitta kutilayotgan ishchi
+        conn.execute(
+            "INSERT INTO employees (id, full_name, phone, role, status, base_salary, created_at) "
+            "VALUES (1, 'Yangi ishchi', '+998900000001', 'worker', 'pending', 0, CURRENT_TIMESTAMP)"
+        )
+    conn.close()
+
+
+def _worker() -> dict:
+    return asyncio.run(_measure(int(os.environ["QUERY_BUDGET_EMPLOYEES"])))
+
+
+# =========================
+# TEKSHIRISH
+# =========================
+def check(sizes=SIZES) -> tuple:
+    runs = {}
+    for employees in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "budget.db")
+            _seed(path, employees)
+
+            env = dict(
+                os.environ,
+                DB_URL=f"sqlite+aiosqlite:///{path}",
+                QUERY_BUDGET_EMPLOYEES=str(employees),
+                METRICS_PORT="0",
+                REPORT_EXECUTOR="thread",
+            )
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker"],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            runs[employees] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    smallest, largest = min(sizes), max(sizes)
+    failures = []
+    for name, result in runs[largest].items():
+        small = runs[smallest][name]["queries"]
+        large = result["queries"]
+        budget = result["budget"]
+
+        if not (result["handled"] and runs[smallest][name]["handled"]):
+            failures.append(f"{name}: update hech bir handlerga tushmadi")
+        if large > small:
+            failures.append(f"{name}: {smallest} ishchida {small} ta, {largest} ishchida {large} ta so'rov (N+1)")
+        if budget is None:
+            failures.append(f"{name}: @query_budget e'lon qilinmagan")
+        elif max(small, large) > budget:
+            failures.append(f"{name}: {max(small, large)} ta so'rov > budjet {budget}")
+
+    return runs, failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Handlerlar uchun SQL so'rovlar budjeti va N+1 tekshiruvi")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(_worker()))
+        return 0
+
+    runs, failures = check()
+
+    sizes = sorted(runs)
+    print(f"{'handler':<28}" + "".join(f"{size:>8}" for size in sizes) + f"{'budjet':>8}")
+    for name, result in runs[sizes[-1]].items():
+        counts = "".join(f"{runs[size][name]['queries']:>8}" for size in sizes)
+        budget = result["budget"] if result["budget"] is not None else "-"
+        print(f"{name:<28}{counts}{budget:>8}")
+
+    if not failures:
+        print("\nOK: so'rovlar soni ishchilar soniga bog'liq emas va budjet doirasida.")
+        return 0
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
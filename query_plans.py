@@ -0,0 +1,120 @@
+import sys
+from datetime import datetime
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import sqlite
+
+from database import Base, Employee, SalaryHistory
+from balance import (
+    LEDGER_MODELS,
+    balance_query,
+    close_ledger_query,
+    close_salary_query,
+    open_totals_update_query,
+    period_totals_query,
+    year_to_date_query,
+)
+from pagination import picker_query, salary_history_query
+from outbox import due_batch_query, sent_before_query
+
+SAMPLE_EMP_ID = 1064992756
+SAMPLE_MONTH = "2026-03"
+
+
+# =========================
+# TEZ-TEZ ISHLATILADIGAN SO'ROVLAR
+# =========================
+def hot_queries():
+    queries = {
+        "balance_single": balance_query([SAMPLE_EMP_ID]),
+        "balance_approved": balance_query(status="approved"),
+        "pending_list": select(Employee).where(Employee.status == "pending"),
+        "picker_first_page": picker_query("emp", None, None, 20),
+        "picker_next_page": picker_query("emp", "n", SAMPLE_EMP_ID, 20),
+        "picker_prev_page": picker_query("emp", "p", SAMPLE_EMP_ID, 20),
+        "unpaid_salary_rows": (
+            select(SalaryHistory, Employee)
+            .join(Employee, Employee.id == SalaryHistory.employee_id)
+            .where(
+                SalaryHistory.month == SAMPLE_MONTH,
+                SalaryHistory.is_paid == False,
+                Employee.status == "approved"
+            )
+        ),
+        "salary_sheet_existing": select(SalaryHistory.employee_id).where(
+            SalaryHistory.month == SAMPLE_MONTH
+        ),
+        "salary_history_first_page": salary_history_query(SAMPLE_EMP_ID, None, None, 5),
+        "salary_history_older_page": salary_history_query(SAMPLE_EMP_ID, "n", SAMPLE_MONTH, 5),
+        "salary_history_newer_page": salary_history_query(SAMPLE_EMP_ID, "p", SAMPLE_MONTH, 5),
+        "salary_year_to_date": year_to_date_query(SAMPLE_EMP_ID, "2026"),
+        "period_current": period_totals_query(SAMPLE_EMP_ID, SAMPLE_MONTH, SAMPLE_MONTH),
+        "period_history": period_totals_query(SAMPLE_EMP_ID, "2026-01"),
+        "outbox_prune_sent": sent_before_query(datetime(2026, 3, 1)),
+        "outbox_due_batch": due_batch_query(datetime(2026, 3, 1), [SAMPLE_EMP_ID]),
+    }
+
+    # Oyni yopish: close_ledger_month bajaradigan umumiy UPDATE'lar
+    for model, name in LEDGER_MODELS:
+        queries[f"{name}_close_month"] = close_ledger_query(model)
+    queries["salary_close_month"] = close_salary_query(SAMPLE_MONTH)
+    queries["balance_close_month"] = open_totals_update_query()
+
+    return queries
+
+
+def _partial_indexes() -> set:
+    return {
+        index.name
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+        if index.dialect_options["sqlite"]["where"] is not None
+    }
+
+
+def _is_table_scan(detail: str, tables: set, partial: set) -> bool:
+    # "SCAN kpi" yoki "SCAN kpi USING INDEX ..." - ikkalasi ham butun jadval/indeksni o'qiydi.
+    # Qisman indeks (masalan, faqat ochiq yozuvlar) bundan mustasno: unda faqat kerakli qatorlar bor
+    if not detail.startswith("SCAN "):
+        return False
+    words = detail.split()
+    if "INDEX" in words and words[words.index("INDEX") + 1] in partial:
+        return False
+    return words[1] in tables
+
+
+def check_query_plans(conn):
+    tables = set(Base.metadata.tables)
+    partial = _partial_indexes()
+    failures = {}
+
+    for name, stmt in hot_queries().items():
+        sql = str(stmt.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+        plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+        scans = [detail for detail in plan if _is_table_scan(detail, tables, partial)]
+        if scans:
+            failures[name] = plan
+
+    return failures
+
+
+def main() -> int:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with engine.connect() as conn:
+        failures = check_query_plans(conn)
+
+    if not failures:
+        print(f"OK: {len(hot_queries())} ta so'rov indeks orqali bajariladi.")
+        return 0
+
+    for name, plan in failures.items():
+        print(f"FAIL {name}:")
+        for detail in plan:
+            print(f"    {detail}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import io
+import os
+import tempfile
+from typing import NamedTuple, Optional
+
+from aiogram.types import BufferedInputFile, FSInputFile
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from sqlalchemy import select, func, case, cast, String
+
+from database import Employee, EmployeeBalance, get_sync_engine
+from query_budget import query_budget
+
+# Shu hajmdan kichik fayl xotirada yuboriladi, kattasi vaqtinchalik faylda qoladi
+REPORT_SPILL_BYTES = int(os.getenv("REPORT_SPILL_BYTES", str(8 * 1024 * 1024)))
+REPORT_FETCH_SIZE = int(os.getenv("REPORT_FETCH_SIZE", "1000"))
+
+REPORT_COLUMNS = [
+    "F.I.SH",
+    "Telefon raqami",
+    "Oylik turi",
+    "Asosiy maosh (so'm)",
+    "Premiya (so'm)",
+    "Avans (so'm)",
+    "Jarima (so'm)",
+    "Joriy qoldiq (so'm)",
+]
+
+
+class ReportFile(NamedTuple):
+    filename: str
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+    def as_input_file(self):
+        if self.data is not None:
+            return BufferedInputFile(self.data, filename=self.filename)
+        return FSInputFile(self.path, filename=self.filename)
+
+    def cleanup(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class SpillBuffer:
+    # Fayl xotirada yoziladi; limitdan oshsa, vaqtinchalik faylga ko'chiriladi va davomi o'sha yerga
+    # yoziladi. Kichik hisobotlar diskka umuman tegmaydi, kattasi esa xotirada to'planib qolmaydi
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.path: Optional[str] = None
+        self._file = io.BytesIO()
+
+    def write(self, data) -> int:
+        if self.path is None and max(self._file.getbuffer().nbytes, self._file.tell() + len(data)) > self.limit:
+            self._spill()
+        return self._file.write(data)
+
+    def _spill(self):
+        fd, self.path = tempfile.mkstemp(prefix="report_", suffix=".xlsx")
+        spilled = os.fdopen(fd, "w+b")
+        spilled.write(self._file.getbuffer())
+        spilled.seek(self._file.tell())
+        self._file = spilled
+
+    def discard(self):
+        self._file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        # zipfile uchun seek/tell/flush/close va h.k.
+        return getattr(self._file, name)
+
+
+# =========================
+# SO'ROVLAR
+# =========================
+def report_query(single_emp_id: Optional[int] = None):
+    kpis = func.coalesce(EmployeeBalance.total_kpi, 0.0)
+    advances = func.coalesce(EmployeeBalance.total_advance, 0.0)
+    penalties = func.coalesce(EmployeeBalance.total_penalty, 0.0)
+
+    query = (
+        select(
+            Employee.full_name,
+            Employee.phone,
+            case((Employee.salary_type == "Fix", "Oklad"), else_="Foiz"),
+            Employee.base_salary,
+            kpis,
+            advances,
+            penalties,
+            Employee.base_salary + kpis - advances - penalties,
+        )
+        .outerjoin(EmployeeBalance, EmployeeBalance.employee_id == Employee.id)
+        .where(Employee.status == "approved")
+        .order_by(Employee.full_name, Employee.id)
+    )
+    if single_emp_id:
+        query = query.where(Employee.id == single_emp_id)
+
+    return query
+
+
+def width_query(rows_query):
+    # openpyxl write-only rejimida ustun kengligi birinchi qatordan oldin yozilishi shart,
+    # shuning uchun kengliklar oqimdan oldin bitta agregat so'rov bilan olinadi
+    rows = rows_query.order_by(None).subquery()
+    return select(
+        func.count(),
+        *(func.max(func.length(cast(column, String))) for column in rows.c)
+    )
+
+
+# =========================
+# EXCEL YARATISH
+# =========================
+@query_budget(2)
+def render_report(single_emp_id: Optional[int] = None) -> Optional[ReportFile]:
+    rows_query = report_query(single_emp_id)
+    filename = f"Shaxsiy_{single_emp_id}.xlsx" if single_emp_id else "Umumiy_Hisobot.xlsx"
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Hisobot")
+
+    with get_sync_engine().connect() as conn:
+        count, *widths = conn.execute(width_query(rows_query)).one()
+        if not count:
+            return None
+
+        for index, (header, width) in enumerate(zip(REPORT_COLUMNS, widths), start=1):
+            sheet.column_dimensions[get_column_letter(index)].width = max(len(header), width or 0) + 2
+
+        sheet.append(REPORT_COLUMNS)
+
+        result = conn.execution_options(yield_per=REPORT_FETCH_SIZE).execute(rows_query)
+        for row in result:
+            sheet.append(list(row))
+
+    buffer = SpillBuffer(REPORT_SPILL_BYTES)
+    try:
+        workbook.save(buffer)
+    except BaseException:
+        buffer.discard()
+        raise
+
+    if buffer.path:
+        buffer.close()
+        return ReportFile(filename, path=buffer.path)
+    return ReportFile(filename, data=buffer.getvalue())
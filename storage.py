@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from database import async_session, FSMRecord
+
+logger = logging.getLogger(__name__)
+
+FSM_HOT_SIZE = int(os.getenv("FSM_HOT_SIZE", "5000"))
+FSM_IDLE_TTL = float(os.getenv("FSM_IDLE_TTL", "86400"))  # soniya; shundan uzoq harakatsiz holat tashlab ketilgan hisoblanadi
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))  # soniya
+FSM_FLUSH_BATCH = int(os.getenv("FSM_FLUSH_BATCH", "200"))
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "300"))  # soniya
+
+
+class _Entry:
+    __slots__ = ("state", "data", "touched_at")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[dict] = None):
+        self.state = state
+        self.data = data or {}
+        self.touched_at = time.monotonic()
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+# =========================
+# SQLITE FSM STORAGE
+# =========================
+class SQLiteStorage(BaseStorage):
+    # O'qish xotiradagi "issiq" qatlamdan, yozish esa paketlab bazaga (write-behind).
+    # Jarayon kutilmaganda to'xtasa, oxirgi FSM_FLUSH_INTERVAL ichidagi o'zgarishlar yo'qolishi mumkin.
+    def __init__(
+        self,
+        hot_size: int = FSM_HOT_SIZE,
+        idle_ttl: float = FSM_IDLE_TTL,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        flush_batch: int = FSM_FLUSH_BATCH,
+        sweep_interval: float = FSM_SWEEP_INTERVAL,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.hot_size = hot_size
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.sweep_interval = sweep_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.flushed = 0
+        self.expired = 0
+
+        self._hot = OrderedDict()
+        self._dirty = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    # ----- BaseStorage -----
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(storage_key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, entry = await self._entry(key)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        storage_key, entry = await self._entry(key)
+        entry.data = data.copy()
+        self._mark_dirty(storage_key)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, entry = await self._entry(key)
+        return entry.data.copy()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    # ----- issiq qatlam -----
+    async def _entry(self, key: StorageKey):
+        self._ensure_flusher()
+        storage_key = self.key_builder.build(key)
+
+        entry = self._hot.get(storage_key)
+        if entry is not None:
+            if time.monotonic() - entry.touched_at > self.idle_ttl and not entry.is_empty():
+                # Tashlab ketilgan holat: yangi oqim noldan boshlanadi
+                self.expired += 1
+                entry.state, entry.data = None, {}
+                self._mark_dirty(storage_key)
+            self.hits += 1
+            entry.touched_at = time.monotonic()
+            self._hot.move_to_end(storage_key)
+            return storage_key, entry
+
+        self.misses += 1
+        async with async_session() as session:
+            row = (
+                await session.execute(
+                    select(FSMRecord.state, FSMRecord.data, FSMRecord.updated_at)
+                    .where(FSMRecord.key == storage_key)
+                )
+            ).first()
+
+        # Baza kutilayotganda boshqa so'rov yozuvni yuklagan yoki o'zgartirgan bo'lishi mumkin
+        entry = self._hot.get(storage_key)
+        if entry is not None:
+            return storage_key, entry
+
+        if row is None:
+            entry = _Entry()
+        elif row.updated_at < datetime.utcnow() - timedelta(seconds=self.idle_ttl):
+            self.expired += 1
+            entry = _Entry()
+            self._mark_dirty(storage_key)
+        else:
+            entry = _Entry(row.state, json.loads(row.data))
+
+        self._hot[storage_key] = entry
+        self._evict_overflow()
+        return storage_key, entry
+
+    def _evict_overflow(self):
+        # Faqat bazaga yozilgan yozuvlar chiqariladi; yozilmaganlari navbatdagi flush'dan keyin
+        if len(self._hot) <= self.hot_size:
+            return
+        for storage_key in list(self._hot):
+            if len(self._hot) <= self.hot_size:
+                break
+            if storage_key not in self._dirty:
+                del self._hot[storage_key]
+
+    def _mark_dirty(self, storage_key: str):
+        self._dirty.add(storage_key)
+        if len(self._dirty) >= self.flush_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    # ----- bazaga yozish -----
+    def _ensure_flusher(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+                if time.monotonic() >= self._next_sweep:
+                    await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("FSM holatlarini bazaga yozishda xatolik")
+
+    async def flush(self) -> int:
+        if not self._dirty:
+            return 0
+
+        keys = list(self._dirty)
+        self._dirty.clear()
+
+        now = datetime.utcnow()
+        upserts = []
+        deletes = []
+        for storage_key in keys:
+            entry = self._hot.get(storage_key)
+            if entry is None or entry.is_empty():
+                deletes.append(storage_key)
+            else:
+                upserts.append({
+                    "key": storage_key,
+                    "state": entry.state,
+                    "data": json.dumps(entry.data, ensure_ascii=False),
+                    "updated_at": now,
+                })
+
+        try:
+            async with async_session() as session:
+                if upserts:
+                    stmt = insert(FSMRecord)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[FSMRecord.key],
+                        set_={
+                            "state": stmt.excluded.state,
+                            "data": stmt.excluded.data,
+                            "updated_at": stmt.excluded.updated_at,
+                        }
+                    )
+                    await session.execute(stmt, upserts)
+                if deletes:
+                    await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(deletes)))
+                await session.commit()
+        except Exception:
+            # Keyingi urinishda qayta yoziladi
+            self._dirty.update(keys)
+            raise
+
+        self.flushed += len(keys)
+        return len(keys)
+
+    async def sweep(self):
+        self._next_sweep = time.monotonic() + self.sweep_interval
+
+        cutoff = time.monotonic() - self.idle_ttl
+        for storage_key, entry in list(self._hot.items()):
+            if entry.touched_at >= cutoff:
+                continue
+            if not entry.is_empty():
+                self.expired += 1
+                self._dirty.add(storage_key)
+            del self._hot[storage_key]
+        await self.flush()
+
+        async with async_session() as session:
+            result = await session.execute(
+                delete(FSMRecord).where(
+                    FSMRecord.updated_at < datetime.utcnow() - timedelta(seconds=self.idle_ttl)
+                )
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.info("FSM: %s ta tashlab ketilgan holat o'chirildi", result.rowcount)
+
+    def stats(self) -> dict:
+        return {
+            "hot": len(self._hot),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "flushed": self.flushed,
+            "expired": self.expired,
+        }
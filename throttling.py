@@ -0,0 +1,87 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))  # so'rov/soniya, bitta foydalanuvchi uchun
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))  # ketma-ket ruxsat etilgan so'rovlar
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))
+
+
+# =========================
+# TOKEN BUCKET
+# =========================
+class TokenBuckets:
+    # Har bir foydalanuvchi uchun [tokenlar, oxirgi yangilanish] - ikki son.
+    # Uzoq vaqt jim turgan foydalanuvchining chelagi baribir to'la, shuning uchun LRU bo'yicha
+    # chiqarib yuborish hech kimni jazolamaydi: qaytib kelsa to'la chelak bilan boshlaydi
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST, max_users: int = THROTTLE_MAX_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.allowed = 0
+        self.throttled = 0
+        self._buckets = OrderedDict()
+
+    def consume(self, user_id: int) -> bool:
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [self.burst, now]
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(user_id)
+
+        if bucket[0] < 1:
+            self.throttled += 1
+            return False
+
+        bucket[0] -= 1
+        self.allowed += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._buckets),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+        }
+
+
+user_buckets = TokenBuckets()
+
+
+# =========================
+# MIDDLEWARE
+# =========================
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, buckets: TokenBuckets = user_buckets):
+        self.buckets = buckets
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        if user is None or self.buckets.consume(user.id):
+            return await handler(event, data)
+
+        # Tugma "aylanib" qolmasligi uchun callback'ga javob beriladi
+        await event.answer("⏳ Juda tez bosyapsiz, biroz kuting.")
+        return None
+
+
+def install_throttling(*routers):
+    # Ichki middleware: faqat handlerga tushgan update'lar hisoblanadi.
+    # Faqat tugmalar cheklanadi: og'ir so'rovlar (hisobot, tarix) callback'larda, yozilgan xabarlar
+    # (/start, ro'yxatdan o'tishdagi ism va telefon) esa jim tashlab yuborilmasligi kerak
+    middleware = ThrottlingMiddleware()
+    for router in routers:
+        router.callback_query.middleware(middleware)
@@ -4,9 +4,21 @@ from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select, desc
-
-from database import async_session, Employee, KPI, Advance, Penalty, SalaryHistory
+from sqlalchemy import select
+
+from database import async_session, Employee
+from balance import get_employee_balance, get_year_to_date_totals
+from cache import (
+    bump_roster_version,
+    adjust_pending_count,
+    employee_directory,
+    rendered_responses,
+    view_key,
+    is_displayed,
+)
+from outbox import enqueue_notification, wake_dispatcher
+from pagination import load_salary_history_page, parse_history_callback
+from query_budget import query_budget
 
 user_router = Router()
 ADMIN_ID = int(os.getenv("ADMIN_ID", "1064992756"))
@@ -35,53 +47,52 @@ def get_user_main_kb():
 
 
 @user_router.message(CommandStart())
+@query_budget(1)
 async def user_start(message: types.Message, state: FSMContext):
     await state.clear()
     user_id = message.from_user.id
 
-    async with async_session() as session:
-        employee = await session.scalar(
-            select(Employee).where(Employee.id == user_id)
+    employee = await employee_directory.get(user_id)
+
+    # 1) Bazada yo'q bo'lsa - registratsiya
+    if not employee:
+        await message.answer(
+            "👋 <b>Assalomu alaykum! Ishchilar ro'yxatiga xush kelibsiz.</b>\n\n"
+            "Iltimos, ro'yxatdan o'tish uchun to'liq ism-sharifingizni kiriting:",
+            parse_mode="HTML"
+        )
+        await state.set_state(RegisterFSM.full_name)
+        return
+
+    # 2) Pending bo'lsa
+    if employee.status == "pending":
+        await message.answer(
+            "⏳ <b>So'rovingiz qabul qilingan.</b>\n\n"
+            "Rahbariyat tasdiqlashini kuting. Tasdiqlangach sizga xabar yuboriladi.",
+            parse_mode="HTML"
         )
+        return
 
-        # 1) Bazada yo'q bo'lsa - registratsiya
-        if not employee:
-            await message.answer(
-                "👋 <b>Assalomu alaykum! Ishchilar ro'yxatiga xush kelibsiz.</b>\n\n"
-                "Iltimos, ro'yxatdan o'tish uchun to'liq ism-sharifingizni kiriting:",
-                parse_mode="HTML"
-            )
-            await state.set_state(RegisterFSM.full_name)
-            return
-
-        # 2) Pending bo'lsa
-        if employee.status == "pending":
-            await message.answer(
-                "⏳ <b>So'rovingiz qabul qilingan.</b>\n\n"
-                "Rahbariyat tasdiqlashini kuting. Tasdiqlangach sizga xabar yuboriladi.",
-                parse_mode="HTML"
-            )
-            return
-
-        # 3) Fired bo'lsa
-        if employee.status == "fired":
-            await message.answer(
-                "🚫 <b>Siz faol ishchilar ro'yxatida emassiz.</b>\n"
-                "Savollar bo'lsa admin bilan bog'laning.",
-                parse_mode="HTML"
-            )
-            return
-
-        # 4) Approved bo'lsa
+    # 3) Fired bo'lsa
+    if employee.status == "fired":
         await message.answer(
-            f"Assalomu alaykum, <b>{employee.full_name}</b>! 👋\n\n"
-            "Ishchi paneliga xush kelibsiz.",
-            reply_markup=get_user_main_kb(),
+            "🚫 <b>Siz faol ishchilar ro'yxatida emassiz.</b>\n"
+            "Savollar bo'lsa admin bilan bog'laning.",
             parse_mode="HTML"
         )
+        return
+
+    # 4) Approved bo'lsa
+    await message.answer(
+        f"Assalomu alaykum, <b>{employee.full_name}</b>! 👋\n\n"
+        "Ishchi paneliga xush kelibsiz.",
+        reply_markup=get_user_main_kb(),
+        parse_mode="HTML"
+    )
 
 
 @user_router.message(RegisterFSM.full_name)
+@query_budget(0)
 async def process_reg_name(message: types.Message, state: FSMContext):
     full_name = (message.text or "").strip()
 
@@ -94,6 +105,7 @@ async def process_reg_name(message: types.Message, state: FSMContext):
 
 
 @user_router.message(RegisterFSM.phone)
+@query_budget(3)
 async def process_reg_phone(message: types.Message, state: FSMContext):
     phone = (message.text or "").strip()
     data = await state.get_data()
@@ -117,7 +129,19 @@ async def process_reg_phone(message: types.Message, state: FSMContext):
             status="pending"
         )
         session.add(new_emp)
+        enqueue_notification(
+            session,
+            ADMIN_ID,
+            f"🔔 <b>Yangi ishchi ro'yxatdan o'tdi!</b>\n\n"
+            f"👤 Ismi: {data['full_name']}\n"
+            f"📞 Tel: {phone}\n\n"
+            f"Tasdiqlash uchun /admin panelga kiring."
+        )
         await session.commit()
+        wake_dispatcher()
+        bump_roster_version()
+        adjust_pending_count(1)
+        employee_directory.invalidate(user_id)
 
     await message.answer(
         "✅ <b>So'rovingiz adminga yuborildi!</b>\n\n"
@@ -125,70 +149,43 @@ async def process_reg_phone(message: types.Message, state: FSMContext):
         parse_mode="HTML"
     )
 
-    try:
-        await message.bot.send_message(
-            chat_id=ADMIN_ID,
-            text=(
-                f"🔔 <b>Yangi ishchi ro'yxatdan o'tdi!</b>\n\n"
-                f"👤 Ismi: {data['full_name']}\n"
-                f"📞 Tel: {phone}\n\n"
-                f"Tasdiqlash uchun /admin panelga kiring."
-            ),
-            parse_mode="HTML"
-        )
-    except Exception:
-        pass
-
     await state.clear()
 
 
 @user_router.callback_query(F.data == "current_month_stats")
+@query_budget(1)
 async def show_current_stats(call: types.CallbackQuery):
     user_id = call.from_user.id
 
-    async with async_session() as session:
-        emp = await session.scalar(select(Employee).where(Employee.id == user_id))
-        if not emp:
+    emp = await employee_directory.get(user_id)
+    if not emp:
+        return await call.answer("Siz bazada topilmadingiz.", show_alert=True)
+
+    if emp.status != "approved":
+        return await call.answer("Sizga bu bo'limdan foydalanish ruxsat etilmagan.", show_alert=True)
+
+    kb = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_main")]
+        ]
+    )
+
+    # Hisob o'zgarmagan bo'lsa, oxirgi chizilgan hisobot qaytariladi
+    key = view_key(user_id, "current_month_stats")
+    text = rendered_responses.get(key)
+    if text is None:
+        async with async_session() as session:
+            calc = await get_employee_balance(session, user_id)
+        if not calc:
             return await call.answer("Siz bazada topilmadingiz.", show_alert=True)
 
-        if emp.status != "approved":
-            return await call.answer("Sizga bu bo'limdan foydalanish ruxsat etilmagan.", show_alert=True)
-
-        kpis = sum((
-            await session.scalars(
-                select(KPI.amount).where(
-                    KPI.employee_id == user_id,
-                    KPI.is_closed == False
-                )
-            )
-        ).all())
-
-        advances = sum((
-            await session.scalars(
-                select(Advance.amount).where(
-                    Advance.employee_id == user_id,
-                    Advance.is_closed == False
-                )
-            )
-        ).all())
-
-        penalties = sum((
-            await session.scalars(
-                select(Penalty.amount).where(
-                    Penalty.employee_id == user_id,
-                    Penalty.is_closed == False
-                )
-            )
-        ).all())
-
-        current_balance = emp.base_salary + kpis - advances - penalties
-        salary_type_text = "Asosiy (FIX)" if emp.salary_type == "Fix" else "Faqat KPI"
+        emp = calc["employee"]
 
-        kb = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_main")]
-            ]
-        )
+        kpis = calc["kpis"]
+        advances = calc["advances"]
+        penalties = calc["penalties"]
+        current_balance = calc["current_balance"]
+        salary_type_text = "Asosiy (FIX)" if emp.salary_type == "Fix" else "Faqat KPI"
 
         text = (
             f"📊 <b>JORIY OY HISOBOTINGIZ:</b>\n\n"
@@ -201,78 +198,110 @@ async def show_current_stats(call: types.CallbackQuery):
             f"💰 <b>Joriy qoldiq (Raschyot): {format_money(current_balance)}</b>\n\n"
             f"<i>Bu summa oy yopilgunga qadar o'zgarishi mumkin.</i>"
         )
+        rendered_responses.set(key, text)
 
+    # Xabarda aynan shu matn va tugmalar turgan bo'lsa, edit_text "message is not modified" bilan qaytadi
+    if not is_displayed(call.message, text, kb):
         await call.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
-        await call.answer()
+    await call.answer()
 
 
-@user_router.callback_query(F.data == "salary_history")
-async def show_salary_history(call: types.CallbackQuery):
-    user_id = call.from_user.id
-
+async def render_salary_history(user_id: int, direction=None, anchor_month=None):
     async with async_session() as session:
-        emp = await session.scalar(select(Employee).where(Employee.id == user_id))
-        if not emp:
-            return await call.answer("Siz bazada topilmadingiz.", show_alert=True)
+        rows, has_newer, has_older = await load_salary_history_page(session, user_id, direction, anchor_month)
+        if not rows and anchor_month is not None:
+            # Eski tugma bosilgan (masalan, oy yopilgandan keyin) - birinchi sahifa ko'rsatiladi
+            rows, has_newer, has_older = await load_salary_history_page(session, user_id)
+        if not rows:
+            return (
+                "🗂 <b>Sizda hali yopilgan oyliklar tarixi yo'q.</b>\n"
+                "Oylik yopilgandan keyin bu yerda ko'rinadi."
+            ), None
+
+        ytd = await get_year_to_date_totals(session, user_id)
+
+    text = "🗂 <b>OYLIKLAR TARIXI</b>\n\n"
+    if ytd["months"]:
+        text += (
+            f"📆 <b>{ytd['year']} yil boshidan ({ytd['months']} oy):</b>\n"
+            f"📈 KPI: +{format_money(ytd['kpis'])}\n"
+            f"💸 Avans: -{format_money(ytd['advances'])}\n"
+            f"⚠️ Jarima: -{format_money(ytd['penalties'])}\n"
+            f"💰 <b>Jami oylik: {format_money(ytd['salaries'])}</b>\n"
+            f"〰️〰️〰️〰️〰️〰️〰️〰️〰️\n\n"
+        )
 
-        histories = (
-            await session.scalars(
-                select(SalaryHistory)
-                .where(
-                    SalaryHistory.employee_id == user_id,
-                    SalaryHistory.is_closed == True
-                )
-                .order_by(desc(SalaryHistory.created_at))
-                .limit(5)
-            )
-        ).all()
-
-        kb = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_main")]
-            ]
+    for month, total_kpi, total_advance, total_penalty, final_salary, is_paid in rows:
+        paid_text = "✅ To'langan" if is_paid else "⏳ To'lanmagan"
+
+        text += (
+            f"📅 <b>Oy: {month}</b>\n"
+            f"📈 KPI: +{format_money(total_kpi)}\n"
+            f"💸 Avans: -{format_money(total_advance)}\n"
+            f"⚠️ Jarima: -{format_money(total_penalty)}\n"
+            f"💰 <b>Yakuniy oylik: {format_money(final_salary)}</b>\n"
+            f"📌 Holat: {paid_text}\n"
+            f"〰️〰️〰️〰️〰️〰️〰️〰️〰️\n"
         )
 
-        if not histories:
-            await call.message.edit_text(
-                "🗂 <b>Sizda hali yopilgan oyliklar tarixi yo'q.</b>\n"
-                "Oylik yopilgandan keyin bu yerda ko'rinadi.",
-                reply_markup=kb,
-                parse_mode="HTML"
-            )
-            return await call.answer()
-
-        text = "🗂 <b>OXIRGI OYLIKLAR TARIXI:</b>\n\n"
-        for record in histories:
-            paid_text = "✅ To'langan" if getattr(record, "is_paid", False) else "⏳ To'lanmagan"
-
-            text += (
-                f"📅 <b>Oy: {record.month}</b>\n"
-                f"📈 KPI: +{format_money(record.total_kpi)}\n"
-                f"💸 Avans: -{format_money(record.total_advance)}\n"
-                f"⚠️ Jarima: -{format_money(record.total_penalty)}\n"
-                f"💰 <b>Yakuniy oylik: {format_money(record.final_salary)}</b>\n"
-                f"📌 Holat: {paid_text}\n"
-                f"〰️〰️〰️〰️〰️〰️〰️〰️〰️\n"
-            )
+    # ◀️ - yangiroq oylar, ▶️ - eskiroq oylar
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"hist_p_{rows[0].month}"))
+    if has_older:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"hist_n_{rows[-1].month}"))
+    return text, nav
+
+
+async def _show_salary_history(call: types.CallbackQuery, direction=None, anchor_month=None):
+    user_id = call.from_user.id
+
+    emp = await employee_directory.get(user_id)
+    if not emp:
+        return await call.answer("Siz bazada topilmadingiz.", show_alert=True)
+
+    key = view_key(user_id, f"salary_history:{direction}:{anchor_month}")
+    rendered = rendered_responses.get(key)
+    if rendered is None:
+        rendered = await render_salary_history(user_id, direction, anchor_month)
+        rendered_responses.set(key, rendered)
+    text, nav = rendered
 
+    keyboard = [nav] if nav else []
+    keyboard.append([InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_main")])
+    kb = InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    if not is_displayed(call.message, text, kb):
         await call.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
-        await call.answer()
+    await call.answer()
+
+
+@user_router.callback_query(F.data == "salary_history")
+@query_budget(2)
+async def show_salary_history(call: types.CallbackQuery):
+    await _show_salary_history(call)
+
+
+@user_router.callback_query(F.data.startswith("hist_"))
+@query_budget(2)
+async def salary_history_page(call: types.CallbackQuery):
+    direction, anchor_month = parse_history_callback(call.data)
+    await _show_salary_history(call, direction, anchor_month)
 
 
 @user_router.callback_query(F.data == "back_to_main")
+@query_budget(0)
 async def back_to_main_menu(call: types.CallbackQuery):
     user_id = call.from_user.id
 
-    async with async_session() as session:
-        emp = await session.scalar(select(Employee).where(Employee.id == user_id))
-        if not emp:
-            return await call.answer("Siz bazada topilmadingiz.", show_alert=True)
+    emp = await employee_directory.get(user_id)
+    if not emp:
+        return await call.answer("Siz bazada topilmadingiz.", show_alert=True)
 
-        await call.message.edit_text(
-            f"Assalomu alaykum, <b>{emp.full_name}</b>! 👋\n\n"
-            "Asosiy menyuga qaytdingiz.",
-            reply_markup=get_user_main_kb(),
-            parse_mode="HTML"
-        )
-        await call.answer()
+    await call.message.edit_text(
+        f"Assalomu alaykum, <b>{emp.full_name}</b>! 👋\n\n"
+        "Asosiy menyuga qaytdingiz.",
+        reply_markup=get_user_main_kb(),
+        parse_mode="HTML"
+    )
+    await call.answer()
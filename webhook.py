@@ -0,0 +1,166 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+from typing import Optional
+
+from aiohttp import web
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # tashqi manzil, masalan https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "100"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Telegram tomonidagi parallel ulanishlar
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))  # soniya
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# =========================
+# WEBHOOK SERVERI
+# =========================
+class WebhookServer:
+    def __init__(
+        self,
+        bot,
+        dp,
+        secret: str,
+        path: str = WEBHOOK_PATH,
+        host: str = WEBHOOK_HOST,
+        port: int = WEBHOOK_PORT,
+        max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+        drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT,
+    ):
+        self.bot = bot
+        self.dp = dp
+        self.secret = secret
+        self.path = path
+        self.host = host
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self.drain_timeout = drain_timeout
+
+        self.accepted = 0
+        self.rejected = 0
+        self.unauthorized = 0
+        self.failed = 0
+
+        self._tasks = set()
+        self._closing = False
+        self._runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.build_app(), handle_signals=False)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        # port=0 bo'lsa OS bo'sh portni tanlaydi
+        if self._runner.addresses:
+            self.port = self._runner.addresses[0][1]
+        logger.info("🌐 Webhook server %s:%s%s manzilida", self.host, self.port, self.path)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            self.unauthorized += 1
+            return web.Response(status=401)
+
+        # To'xtash yoki limit to'lganda 2xx qaytarilmaydi - Telegram update'ni keyinroq qayta yuboradi
+        if self._closing or len(self._tasks) >= self.max_in_flight:
+            self.rejected += 1
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception:
+            logger.warning("Webhook: noto'g'ri update keldi")
+            return web.Response(status=400)
+
+        self.accepted += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.failed += 1
+            logger.exception("Update #%s qayta ishlanmadi", update.update_id)
+
+    async def drain(self):
+        # Yangi update'lar qabul qilinmaydi, boshlanganlari tugashi kutiladi
+        self._closing = True
+        if not self._tasks:
+            return
+
+        logger.info("⏳ %s ta update tugashi kutilmoqda...", len(self._tasks))
+        done, pending = await asyncio.wait(set(self._tasks), timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("%s ta update %s soniyada tugamadi va bekor qilindi", len(pending), self.drain_timeout)
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def stop(self):
+        await self.drain()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._tasks),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "unauthorized": self.unauthorized,
+            "failed": self.failed,
+        }
+
+
+# =========================
+# ISHGA TUSHIRISH
+# =========================
+async def run_webhook(bot, dp, stop_event: Optional[asyncio.Event] = None):
+    if not WEBHOOK_URL:
+        raise ValueError("❌ WEBHOOK_URL topilmadi! Webhook rejimi uchun tashqi manzil kerak.")
+    if not WEBHOOK_SECRET:
+        raise ValueError("❌ WEBHOOK_SECRET topilmadi! Webhook so'rovlarini tekshirish uchun kerak.")
+
+    server = WebhookServer(bot, dp, secret=WEBHOOK_SECRET)
+
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    await server.start()
+    try:
+        # drop_pending_updates yo'q: bot o'chiq paytida kelgan update'lar Telegram'da navbatda kutadi
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info("🚀 Webhook o'rnatildi, update'lar kutilmoqda...")
+        await stop_event.wait()
+    finally:
+        logger.info("🛑 Webhook server to'xtatilmoqda...")
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
@@ -0,0 +1,380 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))  # 1 - bitta jarayon (oddiy rejim)
+WORKER_QUEUE_LIMIT = int(os.getenv("WORKER_QUEUE_LIMIT", "200"))  # bitta ishchida boshlanmagan update'lar
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "1"))  # soniya, har qulashda ikki barobar
+WORKER_RESTART_MAX_DELAY = float(os.getenv("WORKER_RESTART_MAX_DELAY", "30"))  # soniya
+WORKER_STABLE_AFTER = float(os.getenv("WORKER_STABLE_AFTER", "60"))  # shuncha ishlagan ishchining qulashlari unutiladi
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "30"))  # soniya
+WORKER_CHECK_INTERVAL = 0.5  # soniya
+POLLING_TIMEOUT = 30  # soniya, getUpdates long polling
+
+
+def shard_key(update) -> int:
+    # Bitta chat (shaxsiy chatda - bitta foydalanuvchi) doim bitta ishchiga tushadi:
+    # update'lar tartibi va FSM holati shu jarayonda qoladi
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+
+# =========================
+# ISHCHI JARAYON
+# =========================
+def _worker_main(index: int, token: str, inbox, events, metrics_port: int, session_factory=None):
+    # Ctrl+C butun guruhga keladi - ishchini supervisor "stop" xabari bilan to'xtatadi
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_loop(index, token, inbox, events, metrics_port, session_factory))
+
+
+def _forget_chain(chains: dict, key: int, task: asyncio.Task):
+    if chains.get(key) is task:
+        del chains[key]
+
+
+async def _worker_loop(index: int, token: str, inbox, events, metrics_port: int, session_factory):
+    # Modullar DB_URL va sozlamalarni import paytida o'qiydi, shuning uchun import shu yerda
+    from aiogram.types import Update
+
+    from bot import create_bot, build_dispatcher
+    from cache import set_invalidation_publisher, apply_invalidation, employee_directory, rendered_responses
+    from jobs import report_queue
+    from metrics import register_collector, start_metrics_server
+    from outbox import set_remote_wakeup
+    from throttling import user_buckets
+
+    bot = create_bot(token, session=session_factory() if session_factory else None)
+    dp = build_dispatcher()
+
+    set_invalidation_publisher(lambda kind, arg: events.put(("invalidate", index, kind, arg)))
+    set_remote_wakeup(lambda: events.put(("wake", index)))
+
+    register_collector("employee_cache", employee_directory.stats)
+    register_collector("response_cache", rendered_responses.stats)
+    register_collector("throttle", user_buckets.stats)
+    register_collector("report_queue", report_queue.stats)
+    register_collector("fsm", dp.storage.stats)
+    metrics_runner = await start_metrics_server(port=metrics_port)
+
+    # Bitta chatning update'lari ketma-ket, turli chatlarniki parallel bajariladi
+    chains = {}
+
+    async def process(previous: Optional[asyncio.Task], update_id: int, payload: str):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        # Boshlanganini supervisor'ga bildiramiz: qulasak, bu update qayta yuborilmaydi
+        events.put(("started", index, update_id))
+        try:
+            update = Update.model_validate_json(payload, context={"bot": bot})
+            await dp.feed_update(bot, update)
+        except Exception:
+            logger.exception("Ishchi #%s: update #%s qayta ishlanmadi", index, update_id)
+
+    loop = asyncio.get_running_loop()
+    logger.info("👷 Ishchi #%s ishga tushdi (pid %s)", index, os.getpid())
+    try:
+        while True:
+            message = await loop.run_in_executor(None, inbox.get)
+            kind = message[0]
+            if kind == "update":
+                _, key, update_id, payload = message
+                task = asyncio.create_task(process(chains.get(key), update_id, payload))
+                chains[key] = task
+                task.add_done_callback(partial(_forget_chain, chains, key))
+            elif kind == "invalidate":
+                apply_invalidation(message[1], message[2])
+            elif kind == "stop":
+                break
+
+        await asyncio.gather(*list(chains.values()), return_exceptions=True)
+    finally:
+        set_invalidation_publisher(None)
+        set_remote_wakeup(None)
+        await dp.fsm.storage.close()
+        await report_queue.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        logger.info("👷 Ishchi #%s to'xtadi", index)
+
+
+# =========================
+# SUPERVISOR
+# =========================
+class _Worker:
+    __slots__ = ("index", "process", "inbox", "pending", "failures", "started_at", "restart_at")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.inbox = None
+        self.pending = OrderedDict()  # update_id -> (key, payload), ishchi hali boshlamagan
+        self.failures = 0
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = None
+
+
+class WorkerPool:
+    # Dispatcher o'rnida ishlatiladi (feed_update, resolve_used_update_types, emit_*):
+    # run_webhook va polling update'larni shu yerga beradi, bu yerdan esa ishchilarga taqsimlanadi
+    def __init__(
+        self,
+        workers: int,
+        token: str,
+        allowed_updates: list,
+        queue_limit: int = WORKER_QUEUE_LIMIT,
+        metrics_port: int = 0,
+        session_factory=None,
+    ):
+        self.token = token
+        self.allowed_updates = allowed_updates
+        self.queue_limit = queue_limit
+        self.metrics_port = metrics_port
+        self.session_factory = session_factory
+
+        self.routed = 0
+        self.replayed = 0
+        self.restarts = 0
+
+        # spawn: asosiy jarayonda event loop va aiosqlite thread'lari bor
+        self._ctx = multiprocessing.get_context("spawn")
+        # SimpleQueue'ga yozish sinxron: ishchi qulasa ham "started" xabari yo'qolmaydi
+        self._events = self._ctx.SimpleQueue()
+        self._workers = [_Worker(i) for i in range(workers)]
+        self._closing = False
+        self._supervisor: Optional[asyncio.Task] = None
+        self._pump: Optional[asyncio.Task] = None
+
+    def start(self):
+        for worker in self._workers:
+            self._spawn(worker)
+        self._supervisor = asyncio.create_task(self._supervise())
+        self._pump = asyncio.create_task(self._read_events())
+
+    def _spawn(self, worker: _Worker):
+        metrics_port = self.metrics_port + 1 + worker.index if self.metrics_port else 0
+        worker.inbox = self._ctx.Queue()
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, self.token, worker.inbox, self._events, metrics_port, self.session_factory),
+            name=f"bot-worker-{worker.index}",
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+
+        # Oldingi jarayon boshlashga ulgurmagan update'lar yangisiga o'sha tartibda beriladi
+        for update_id, (key, payload) in worker.pending.items():
+            worker.inbox.put(("update", key, update_id, payload))
+            self.replayed += 1
+
+    def _discard_inbox(self, worker: _Worker):
+        # O'qilmagan xabarlar pending'dan qayta yuboriladi; feeder thread to'lgan pipe'da
+        # osilib qolib, jarayon chiqishini to'smasligi kerak
+        if worker.inbox is not None:
+            worker.inbox.cancel_join_thread()
+            worker.inbox.close()
+            worker.inbox = None
+
+    # ----- Dispatcher o'rnida -----
+    async def feed_update(self, bot, update, **kwargs):
+        key = shard_key(update)
+        worker = self._workers[key % len(self._workers)]
+
+        # Ishchi ortda qolsa qabul qilish sekinlashadi (webhook'da in-flight limiti 503 qaytaradi)
+        while len(worker.pending) >= self.queue_limit and not self._closing:
+            await asyncio.sleep(0.01)
+
+        payload = update.model_dump_json(exclude_none=True, by_alias=True)
+        worker.pending[update.update_id] = (key, payload)
+        if worker.inbox is not None:
+            worker.inbox.put(("update", key, update.update_id, payload))
+        self.routed += 1
+
+    def resolve_used_update_types(self, **kwargs) -> list:
+        return self.allowed_updates
+
+    async def emit_startup(self, **kwargs):
+        pass
+
+    async def emit_shutdown(self, **kwargs):
+        pass
+
+    # ----- kuzatish -----
+    async def _supervise(self):
+        while not self._closing:
+            now = time.monotonic()
+            for worker in self._workers:
+                if worker.process is not None and not worker.process.is_alive():
+                    exitcode = worker.process.exitcode
+                    worker.process = None
+                    self._discard_inbox(worker)
+
+                    if now - worker.started_at > WORKER_STABLE_AFTER:
+                        worker.failures = 0
+                    delay = min(WORKER_RESTART_MAX_DELAY, WORKER_RESTART_DELAY * 2 ** worker.failures)
+                    worker.failures += 1
+                    worker.restart_at = now + delay
+                    logger.error(
+                        "❌ Ishchi #%s to'xtab qoldi (kod %s), %.1f soniyadan keyin qayta ishga tushiriladi. "
+                        "Navbatda %s ta update",
+                        worker.index, exitcode, delay, len(worker.pending)
+                    )
+                elif worker.process is None and worker.restart_at is not None and now >= worker.restart_at:
+                    self._spawn(worker)
+                    self.restarts += 1
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+
+    async def _read_events(self):
+        from outbox import wake_dispatcher
+
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._events.get)
+            kind = message[0]
+            if kind == "closed":
+                return
+
+            index = message[1]
+            if kind == "started":
+                self._workers[index].pending.pop(message[2], None)
+            elif kind == "invalidate":
+                for worker in self._workers:
+                    if worker.index != index and worker.inbox is not None:
+                        worker.inbox.put(("invalidate", message[2], message[3]))
+            elif kind == "wake":
+                wake_dispatcher()
+
+    async def stop(self):
+        self._closing = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+
+        # "stop" navbat oxirida: ishchilar qabul qilingan update'larni tugatib chiqadi
+        for worker in self._workers:
+            if worker.inbox is not None:
+                worker.inbox.put(("stop",))
+
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            await loop.run_in_executor(None, worker.process.join, WORKER_STOP_TIMEOUT)
+            if worker.process.is_alive():
+                logger.warning("Ishchi #%s %s soniyada to'xtamadi", worker.index, WORKER_STOP_TIMEOUT)
+                worker.process.terminate()
+                await loop.run_in_executor(None, worker.process.join, 5)
+                self._discard_inbox(worker)
+
+        if self._pump is not None:
+            self._events.put(("closed",))
+            await self._pump
+
+        left = sum(len(worker.pending) for worker in self._workers)
+        if left:
+            logger.warning("⚠️ %s ta update qayta ishlanmay qoldi", left)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "alive": sum(1 for worker in self._workers if worker.process is not None and worker.process.is_alive()),
+            "pending": sum(len(worker.pending) for worker in self._workers),
+            "routed": self.routed,
+            "replayed": self.replayed,
+            "restarts": self.restarts,
+        }
+
+
+# =========================
+# QABUL QILUVCHI (POLLING)
+# =========================
+async def poll_updates(bot, pool: WorkerPool, stop_event: asyncio.Event):
+    await bot.delete_webhook(drop_pending_updates=True)
+
+    offset = None
+    while not stop_event.is_set():
+        try:
+            updates = await bot.get_updates(
+                offset=offset,
+                timeout=POLLING_TIMEOUT,
+                allowed_updates=pool.resolve_used_update_types()
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("getUpdates xatolik berdi, qayta urinilmoqda...")
+            await asyncio.sleep(1)
+            continue
+
+        for update in updates:
+            await pool.feed_update(bot, update)
+            offset = update.update_id + 1
+
+
+# =========================
+# ISHGA TUSHIRISH
+# =========================
+async def run_workers(token: str, workers: int = BOT_WORKERS, run_mode: str = "polling"):
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    from bot import create_bot, build_dispatcher
+    from database import init_db
+    from metrics import METRICS_PORT, register_collector, start_metrics_server
+    from outbox import NotificationDispatcher
+    from webhook import run_webhook
+
+    # Migratsiyalar ishchilar ishga tushishidan oldin bir marta
+    await init_db()
+
+    bot = create_bot(token)
+    # Faqat update turlarini aniqlash uchun - update'lar ishchilarda qayta ishlanadi
+    allowed_updates = build_dispatcher(storage=MemoryStorage()).resolve_used_update_types()
+    pool = WorkerPool(workers, token, allowed_updates, metrics_port=METRICS_PORT)
+
+    # Outbox bitta jarayonda: Telegram limitlari umumiy, ishchilar faqat uyg'otadi
+    notifier = NotificationDispatcher(bot)
+    register_collector("outbox", notifier.stats)
+    register_collector("workers", pool.stats)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    metrics_runner = None
+    try:
+        pool.start()
+        notifier.start()
+        metrics_runner = await start_metrics_server()
+        logger.info("🚀 %s ta ishchi bilan ishga tushdi (%s)", workers, run_mode)
+
+        if run_mode == "webhook":
+            await run_webhook(bot, pool, stop_event)
+        else:
+            poller = asyncio.create_task(poll_updates(bot, pool, stop_event))
+            await stop_event.wait()
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+    finally:
+        logger.info("🛑 Ishchilar to'xtatilmoqda...")
+        await pool.stop()
+        await notifier.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()